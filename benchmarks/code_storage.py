@@ -0,0 +1,101 @@
+"""Бенчмарк: размер БД и задержка чтения кода — код в files.code против сжатых блобов code_blobs.
+
+Синтетический корпус: файлы построены из небольшого набора шаблонов, часть — с правками.
+Запуск из корня проекта: python -m benchmarks.code_storage [число файлов]
+"""
+import os, random, sqlite3, statistics, sys, tempfile, time
+
+from database import DBase, SCHEMA_MIGRATIONS, code_hash, zstandard
+
+# Типичная заготовка олимпиадника: макросы и утилиты, которые копируются из решения в решение
+CPP_PRELUDE = "".join(
+    f"template <typename T> inline T util{i}(T a, T b) {{ return a * {i} + b / ({i} + 1); }}\n"
+    for i in range(40)
+)
+PY_PRELUDE = "".join(f"def util{i}(a, b):\n    return a * {i} + b // ({i} + 1)\n\n" for i in range(40))
+
+TEMPLATES = [
+    "#include <bits/stdc++.h>\nusing namespace std;\n" + CPP_PRELUDE.replace("%", "%%") + "\nint main() {\n"
+    "    ios::sync_with_stdio(false);\n    cin.tie(nullptr);\n    int n;\n    cin >> n;\n"
+    "    vector<long long> a(n);\n    for (auto &x : a) cin >> x;\n%s\n    return 0;\n}\n",
+    "import sys\n\ninput = sys.stdin.readline\n\n" + PY_PRELUDE + "\ndef solve():\n    n = int(input())\n"
+    "    a = list(map(int, input().split()))\n%s\n\n\nif __name__ == '__main__':\n    solve()\n",
+    "const lines = require('fs').readFileSync(0, 'utf8').split('\\n');\n"
+    "const n = Number(lines[0]);\nconst a = lines[1].split(' ').map(Number);\n%s\n",
+]
+BODIES = [
+    "    print(sum(a))", "    sort(a.begin(), a.end());", "console.log(a.reduce((s, x) => s + x, 0));",
+    "    print(max(a) - min(a))", "    cout << *max_element(a.begin(), a.end()) << endl;",
+]
+
+
+def make_corpus(count: int) -> list:
+    rng = random.Random(42)
+    corpus = []
+    for i in range(count):
+        body = rng.choice(BODIES)
+        # Каждый третий файл — с уникальной правкой, остальные повторяют шаблоны
+        if i % 3 == 0:
+            body += "\n" + "\n".join(f"    // note {rng.randint(0, 10 ** 9)}" for _ in range(rng.randint(1, 20)))
+        corpus.append(rng.choice(TEMPLATES) % body)
+    return corpus
+
+
+def db_size(path: str) -> int:
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.execute("VACUUM")
+    connection.close()
+    return os.path.getsize(path)
+
+
+def p50_ms(read, ids: list) -> float:
+    times = []
+    for file_id in ids:
+        start = time.perf_counter()
+        read(file_id)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(count: int):
+    corpus = make_corpus(count)
+    files = [{"id": i, "name": f"f{i}", "type": "file", "size": "1 KB", "code": code}
+             for i, code in enumerate(corpus)]
+    sample = random.Random(7).choices(range(1, count + 1), k=min(count, 2000))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # До: исходная схема, код текстом в files.code
+        raw_path = os.path.join(temp_dir, "raw.db")
+        raw = sqlite3.connect(raw_path)
+        for statement in SCHEMA_MIGRATIONS[0] + SCHEMA_MIGRATIONS[1]:
+            raw.execute(statement)
+        raw.executemany("INSERT INTO files (user_id, name, type, size, code) VALUES (1, ?, 'file', ?, ?)",
+                        [(f["name"], f["size"], f["code"]) for f in files])
+        raw.commit()
+        raw_read = p50_ms(lambda i: raw.execute("SELECT code FROM files WHERE id = ?", (i,)).fetchone(), sample)
+        raw.close()
+        raw_size = db_size(raw_path)
+
+        # После: блобы по хешу
+        blob_path = os.path.join(temp_dir, "blobs.db")
+        db = DBase(blob_path)
+        db.init_db()
+        user_id = db.create_user("bench@bench", "bench", "-")
+        db.create_files(user_id, files)
+        blob_read = p50_ms(db.get_file_code, sample)
+        hashes = {i: code_hash(corpus[i - 1]) for i in sample}
+        cached_read = p50_ms(lambda i: db.get_file_code(i, hashes[i]), sample)
+        blobs = db.connection.execute("SELECT COUNT(*) FROM code_blobs").fetchone()[0]
+        db.close()
+        blob_size = db_size(blob_path)
+
+    print(f"files: {count}, unique code blobs: {blobs}, codec: {'zstd' if zstandard else 'zlib'}")
+    print(f"  DB size   files.code: {raw_size / 1024:9.1f} KB   code_blobs: {blob_size / 1024:9.1f} KB"
+          f"  ({raw_size / blob_size:.1f}x smaller)")
+    print(f"  read p50  files.code: {raw_read:9.3f} ms   code_blobs: {blob_read:9.3f} ms"
+          f"   ETag match: {cached_read:.3f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
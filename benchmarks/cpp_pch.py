@@ -0,0 +1,59 @@
+"""Бенчмарк: p50 времени компиляции C++ без PCH и с PCH.
+
+Запуск из корня проекта: python -m benchmarks.cpp_pch [число прогонов]
+"""
+import asyncio, statistics, sys, time
+
+from compilers.cpp import CppCompiler, CPP_PROFILES
+
+PROGRAMS = {
+    "bits/stdc++.h": (
+        "#include <bits/stdc++.h>\n"
+        "using namespace std;\n"
+        "int main() { vector<int> v = {3, 1, 2}; sort(v.begin(), v.end()); "
+        "cout << v[0] << \" // %d\" << endl; }\n"
+    ),
+    "iostream": (
+        "#include <iostream>\n"
+        "int main() { std::cout << \"hello %d\" << std::endl; }\n"
+    ),
+}
+
+
+async def measure(compiler: CppCompiler, template: str, runs: int, tag: str, profile: str) -> float:
+    times = []
+    for i in range(runs):
+        # Уникальный литерал в коде — мимо кеша бинарников
+        code = template % hash((tag, i, time.time()))
+        start = time.perf_counter()
+        result = await compiler.compile_and_run(code, profile=profile)
+        times.append(time.perf_counter() - start)
+        if not result["success"]:
+            raise RuntimeError(result)
+    return statistics.median(times)
+
+
+async def main(runs: int):
+    compiler = CppCompiler()
+    compiler.timeout = 60
+
+    compiler.warm_up()
+    while compiler.pch.builds:
+        await asyncio.sleep(0.1)
+    headers = compiler.pch.headers
+
+    for profile, flags in CPP_PROFILES.items():
+        print(f"profile {profile} ({' '.join(flags)}):")
+        for header, template in PROGRAMS.items():
+            compiler.pch.headers = []
+            before = await measure(compiler, template, runs, "before", profile)
+            compiler.pch.headers = headers
+            after = await measure(compiler, template, runs, "after", profile)
+            print(f"  {header:15} p50 without PCH: {before * 1000:7.1f} ms  "
+                  f"with PCH: {after * 1000:7.1f} ms  ({before / after:.1f}x)")
+
+    print(f"runs per case: {runs}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10))
@@ -0,0 +1,56 @@
+"""Бенчмарк: скорость миграции файлов (файлов в секунду) — по одному create_file и пачкой create_files.
+
+Запуск из корня проекта: python -m benchmarks.migrate [число файлов]
+"""
+import os, sys, tempfile, time
+
+from database import DBase
+
+
+def make_files(count: int) -> list:
+    # Каждая десятая запись — папка, файлы раскладываются по папкам
+    files = []
+    folder = None
+    for i in range(count):
+        if i % 10 == 0:
+            folder = i
+            files.append({"id": i, "name": f"folder{i}", "type": "folder", "size": "0"})
+        else:
+            files.append({"id": i, "name": f"file{i}.py", "type": "file", "size": "2 KB",
+                          "folder": folder, "code": "print('hello')\n" * 128, "code_lang": "python"})
+    return files
+
+
+def bench_single(db: DBase, user_id: int, files: list) -> float:
+    start = time.perf_counter()
+    for file in files:
+        db.create_file(user_id, file["name"], file["type"], file["size"],
+                       file.get("folder"), file.get("code"), file.get("code_lang"))
+    return time.perf_counter() - start
+
+
+def bench_bulk(db: DBase, user_id: int, files: list) -> float:
+    start = time.perf_counter()
+    db.create_files(user_id, files)
+    return time.perf_counter() - start
+
+
+def main(count: int):
+    files = make_files(count)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = DBase(os.path.join(temp_dir, "bench.db"))
+        db.init_db()
+        single_user = db.create_user("single@bench", "single", "-")
+        bulk_user = db.create_user("bulk@bench", "bulk", "-")
+
+        single = bench_single(db, single_user, files)
+        bulk = bench_bulk(db, bulk_user, files)
+        db.close()
+
+    print(f"files: {count}")
+    print(f"  create_file x{count}: {single * 1000:8.1f} ms  {count / single:10.0f} files/s")
+    print(f"  create_files:      {bulk * 1000:8.1f} ms  {count / bulk:10.0f} files/s  ({single / bulk:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
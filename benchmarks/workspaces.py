@@ -0,0 +1,72 @@
+"""Бенчмарк: задержка подготовки и уборки рабочей папки на пути запроса —
+mkdtemp/rmtree во временном каталоге против WorkspacePool (очистка в фоне).
+
+Запуск из корня проекта: python -m benchmarks.workspaces [число запусков]
+"""
+import asyncio, os, shutil, sys, tempfile, time
+
+from compilers.workspace import WorkspacePool
+
+# Файлы типичного запуска C++: исходник и бинарник
+SOURCE = b"#include <bits/stdc++.h>\nint main() { return 0; }\n" * 20
+BINARY = os.urandom(256 * 1024)
+
+
+def populate(path: str):
+    with open(os.path.join(path, "main.cpp"), "wb") as f:
+        f.write(SOURCE)
+    with open(os.path.join(path, "main"), "wb") as f:
+        f.write(BINARY)
+
+
+def percentile(samples: list, q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+async def bench_mkdtemp(runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        path = tempfile.mkdtemp(prefix="compile_")
+        setup = time.perf_counter() - start
+        populate(path)
+        start = time.perf_counter()
+        shutil.rmtree(path, ignore_errors=True)
+        samples.append(setup + time.perf_counter() - start)
+    return samples
+
+
+async def bench_pool(runs: int) -> tuple:
+    pool = WorkspacePool(size=4)
+    pool.warm_up()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        path = pool.acquire()
+        setup = time.perf_counter() - start
+        populate(path)
+        start = time.perf_counter()
+        pool.release(path)
+        samples.append(setup + time.perf_counter() - start)
+        # Даём фоновой очистке отработать, как между задачами воркера
+        await asyncio.sleep(0)
+    while pool.cleaning:
+        await asyncio.sleep(0.001)
+    stats = pool.stats()
+    pool.close()
+    return samples, stats
+
+
+async def main(runs: int):
+    baseline = await bench_mkdtemp(runs)
+    pooled, stats = await bench_pool(runs)
+
+    print(f"runs: {runs}, pool root: {stats['root']}, reused: {stats['reused']}, created: {stats['created']}")
+    for name, samples in (("mkdtemp/rmtree", baseline), ("WorkspacePool", pooled)):
+        print(f"  {name:15} p50 {percentile(samples, 0.5) * 1000:7.3f} ms  "
+              f"p99 {percentile(samples, 0.99) * 1000:7.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
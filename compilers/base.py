@@ -1,7 +1,217 @@
-import asyncio, tempfile, os, shutil
-import subprocess, uuid
+import asyncio, os, time
+import resource, signal, subprocess, uuid
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from compilers.cgroups import JobCgroup, job_cgroups
+from compilers.workspace import WorkspacePool, QuotaWatcher
+from telemetry import span, start_spans
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Лимиты ресурсов запускаемой программы (setrlimit в дочернем процессе до exec).
+# Память ограничивается адресным пространством: RSS ядро через rlimit не ограничивает
+RUN_CPU_TIME_MARGIN = 1  # секунды процессорного времени сверх таймаута
+RUN_MEMORY_LIMIT = 256 * 1024 * 1024
+# Процессы и потоки программы ограничивает pids.max её cgroup, а не RLIMIT_NPROC:
+# тот считает все задачи пользователя, включая потоки самого сервиса.
+# Без cgroup число процессов не ограничивается
+RUN_PROCESS_LIMIT = 64
+RUN_FILE_SIZE_LIMIT = 16 * 1024 * 1024
+
+RLIMIT_RESOURCES = {
+    "cpu": resource.RLIMIT_CPU,
+    "memory": resource.RLIMIT_AS,
+    "file_size": resource.RLIMIT_FSIZE,
+}
+
+# Вердикты пакетного запуска тестов
+VERDICT_OK = "OK"
+VERDICT_WRONG_ANSWER = "WA"
+VERDICT_RUNTIME_ERROR = "RE"
+VERDICT_TIME_LIMIT = "TLE"
+VERDICT_OUTPUT_LIMIT = "OLE"
+VERDICT_COMPILATION_ERROR = "CE"
+VERDICT_SKIPPED = "SKIPPED"
+
+
+async def read_limited(stream: asyncio.StreamReader, limit: int,
+                       on_overflow: Callable[[], None],
+                       on_chunk: Optional[Callable[[bytes], None]] = None) -> bytes:
+    """Читает поток до EOF, сохраняя не больше limit байт; при превышении вызывает on_overflow.
+    
+    Если передан on_chunk, части отдаются ему сразу и не накапливаются в памяти.
+    """
+    chunks = []
+    size = 0
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        overflow = size + len(chunk) > limit
+        if overflow:
+            chunk = chunk[:limit - size]
+        size += len(chunk)
+        if on_chunk is not None:
+            if chunk:
+                on_chunk(chunk)
+        else:
+            chunks.append(chunk)
+        if overflow:
+            on_overflow()
+            break
+    return b"".join(chunks)
+
+
+def stream_to(on_event: Optional[Callable[[str, bytes], None]],
+              event: str) -> Optional[Callable[[bytes], None]]:
+    if on_event is None:
+        return None
+    return lambda chunk: on_event(event, chunk)
+
+
+async def write_stdin(stream: asyncio.StreamWriter, data: bytes):
+    try:
+        if data:
+            stream.write(data)
+            await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # Программа завершилась, не дочитав ввод
+        pass
+    finally:
+        stream.close()
+
+
+async def read_pipe(fd: int, limit: int, on_overflow: Callable[[], None],
+                    on_chunk: Optional[Callable[[bytes], None]] = None) -> bytes:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0)
+    )
+    try:
+        return await read_limited(reader, limit, on_overflow, on_chunk)
+    finally:
+        transport.close()
+
+
+async def write_pipe(fd: int, data: bytes):
+    loop = asyncio.get_running_loop()
+    os.set_blocking(fd, False)
+    view = memoryview(data)
+    try:
+        while view:
+            try:
+                view = view[os.write(fd, view):]
+            except BlockingIOError:
+                waiter = loop.create_future()
+                loop.add_writer(fd, lambda: waiter.done() or waiter.set_result(None))
+                try:
+                    await waiter
+                finally:
+                    loop.remove_writer(fd)
+    except BrokenPipeError:
+        # Программа не дочитала ввод и завершилась
+        pass
+    finally:
+        os.close(fd)
+
+
+def rlimits(limits: Dict[str, int]) -> List[Tuple[int, int, int]]:
+    """Лимиты в виде (ресурс, мягкий, жёсткий), не выше жёстких лимитов самого сервиса"""
+    result = []
+    for name, value in limits.items():
+        # Остальные лимиты (processes) применяются через cgroup
+        if value is None or name not in RLIMIT_RESOURCES:
+            continue
+        resource_id = RLIMIT_RESOURCES[name]
+        # По мягкому лимиту CPU приходит SIGXCPU, жёсткий через секунду — SIGKILL
+        soft, hard = value, value + 1 if name == "cpu" else value
+        _, current = resource.getrlimit(resource_id)
+        if current != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current), min(hard, current)
+        result.append((resource_id, soft, hard))
+    return result
+
+
+def limit_resources(limits: Dict[str, int], cgroup: Optional[JobCgroup] = None) -> Callable[[], None]:
+    """preexec_fn для Popen: переход в cgroup запуска и вызовы setrlimit, всё остальное посчитано заранее"""
+    pairs = rlimits(limits)
+    
+    def apply():
+        if cgroup is not None:
+            cgroup.join()
+        for resource_id, soft, hard in pairs:
+            resource.setrlimit(resource_id, (soft, hard))
+    return apply
+
+
+def usage_result(user: float, system: float, memory: Optional[int]) -> Dict[str, Any]:
+    """Поля результата о потреблении ресурсов: время CPU в секундах, пик RSS в КБ"""
+    return {
+        "cpuTime": round(user + system, 6),
+        "userTime": round(user, 6),
+        "systemTime": round(system, 6),
+        "memory": memory or None,
+    }
+
+
+def usage_fields(result: Dict[str, Any]) -> Dict[str, Any]:
+    # Для ответов, собранных заново при разборе ошибок
+    return {key: result[key] for key in ("cpuTime", "userTime", "systemTime", "memory") if key in result}
+
+
+async def wait_process(pid: int) -> Tuple[int, Any]:
+    """Ждёт завершения дочернего процесса, не блокируя цикл; возвращает (код завершения, rusage)"""
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        # pidfd нет (не Linux или старое ядро) — ждём в потоке
+        _, status, usage = await loop.run_in_executor(None, os.wait4, pid, 0)
+        return os.waitstatus_to_exitcode(status), usage
+    
+    try:
+        waiter = loop.create_future()
+        loop.add_reader(pidfd, lambda: waiter.done() or waiter.set_result(None))
+        try:
+            await waiter
+        finally:
+            loop.remove_reader(pidfd)
+    finally:
+        os.close(pidfd)
+    _, status, usage = os.wait4(pid, 0)
+    return os.waitstatus_to_exitcode(status), usage
+
+
+def kill_group(pid: int):
+    # Программа запускается в своей сессии: убиваем её вместе с потомками
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def diagnostic(line: Optional[int], column: Optional[int], severity: str, message: str) -> Dict[str, Any]:
+    """Одна диагностика проверки синтаксиса; severity — error, warning или note"""
+    return {"line": line, "column": column, "severity": severity, "message": message}
+
+
+def normalize_output(text: str) -> str:
+    # Сравнение с эталоном без учёта пробелов в конце строк и пустых строк в конце
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+
+def case_verdict(result: Dict[str, Any], expected: Optional[str]) -> str:
+    if result.get("timedOut"):
+        return VERDICT_TIME_LIMIT
+    if result.get("truncated"):
+        return VERDICT_OUTPUT_LIMIT
+    if not result.get("success"):
+        return VERDICT_RUNTIME_ERROR
+    if expected is not None and normalize_output(result.get("output") or "") != normalize_output(expected):
+        return VERDICT_WRONG_ANSWER
+    return VERDICT_OK
 
 
 class CompilerBase:
@@ -9,72 +219,312 @@ class CompilerBase:
         self.language = language
         self.timeout = timeout
         self.max_output_size = 1000000  # 1MB
+        # Рабочие папки запусков; main подменяет пул общим для всех языков
+        self.workspaces = WorkspacePool()
+        self.limits = {
+            "cpu": timeout + RUN_CPU_TIME_MARGIN,
+            "memory": RUN_MEMORY_LIMIT,
+            "processes": RUN_PROCESS_LIMIT,
+            "file_size": RUN_FILE_SIZE_LIMIT,
+        }
         
-    async def compile_and_run(self, code: str, input_data: str = "") -> Dict[str, Any]:
+    async def compile_and_run(self, code: str, input_data: str = "", **options) -> Dict[str, Any]:
+        # Длительности фаз (setup, write, compile, run, parse, cleanup) — в result["timings"]
+        spans = start_spans()
         temp_dir = None
         try:
-            temp_dir = tempfile.mkdtemp(prefix="compile_")
-            result = await self._execute(code, input_data, temp_dir)
-            return result
+            with span("setup"):
+                temp_dir = self.workspaces.acquire()
+            result = await self._execute(code, input_data, temp_dir, **options)
         except Exception as e:
-            return {
+            result = {
                 "success": False,
                 "error": f"Compilation error: {str(e)}"
             }
         finally:
-            if temp_dir and os.path.exists(temp_dir):
-                try:
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-                except:
-                    pass
+            if temp_dir:
+                # Папка очищается в фоне, здесь — только возврат в пул
+                with span("cleanup"):
+                    self.workspaces.release(temp_dir)
+        result["timings"] = spans
+        return result
+    
+    async def compile_and_run_batch(self, code: str, cases: List[Dict[str, Any]], concurrency: int = 4,
+                                    stop_on_failure: bool = False, **options) -> Dict[str, Any]:
+        """Компилирует код один раз и прогоняет его на всех тестах, не больше concurrency одновременно"""
+        spans = start_spans()
+        temp_dir = None
+        try:
+            with span("setup"):
+                temp_dir = self.workspaces.acquire()
+            prepared = await self._prepare(code, temp_dir, **options)
+            if not prepared["success"]:
+                prepared.update({"verdict": VERDICT_COMPILATION_ERROR, "cases": [], "passed": 0,
+                                 "total": len(cases), "timings": spans})
+                return prepared
+            
+            semaphore = asyncio.Semaphore(max(1, concurrency))
+            failed = []
+            
+            async def run_case(index: int, case: Dict[str, Any]) -> Dict[str, Any]:
+                async with semaphore:
+                    if stop_on_failure and failed:
+                        return {"verdict": VERDICT_SKIPPED}
+                    
+                    # Своя рабочая папка на тест: файлы, созданные программой, не пересекаются
+                    case_dir = os.path.join(temp_dir, f"case_{index}")
+                    os.mkdir(case_dir)
+                    start_time = time.time()
+                    result = await self._run_prepared(prepared, case.get("input") or "", case_dir)
+                    verdict = case_verdict(result, case.get("expected"))
+                    if verdict != VERDICT_OK:
+                        failed.append(index)
+                    return {
+                        "verdict": verdict,
+                        "output": result.get("output"),
+                        "error": result.get("error"),
+                        "details": result.get("details"),
+                        "time": time.time() - start_time,
+                        "memory": result.get("memory"),
+                        "cpuTime": result.get("cpuTime"),
+                        "truncated": bool(result.get("truncated"))
+                    }
+            
+            results = await asyncio.gather(*(run_case(i, case) for i, case in enumerate(cases)))
+            passed = sum(1 for result in results if result["verdict"] == VERDICT_OK)
+            
+            summary = {
+                "success": passed == len(cases),
+                "verdict": next((r["verdict"] for r in results if r["verdict"] != VERDICT_OK), VERDICT_OK),
+                "cases": results,
+                "passed": passed,
+                "total": len(cases)
+            }
+            summary.update(prepared.get("meta", {}))
+            summary["timings"] = spans
+            return summary
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Compilation error: {str(e)}",
+                "timings": spans
+            }
+        finally:
+            if temp_dir:
+                with span("cleanup"):
+                    self.workspaces.release(temp_dir)
+    
+    def is_cacheable(self, result: Dict[str, Any]) -> bool:
+        # Кешируем только успешные запуски: таймауты и ошибки выполнения
+        # могут зависеть от нагрузки на сервер и не воспроизводиться
+        return bool(result.get("success"))
+    
+    async def _execute(self, code: str, input_data: str, temp_dir: str, on_event=None,
+                       **options) -> Dict[str, Any]:
+        prepared = await self._prepare(code, temp_dir, on_event=on_event, **options)
+        if not prepared["success"]:
+            return prepared
+        
+        # Проверка на требования ввода
+        input_check = self._check_input_requirements(prepared["code"])
+        if input_check["requiresInput"] and not input_data:
+            return {
+                "success": False,
+                "requiresInput": True,
+                "inputDescription": input_check["inputDescription"],
+                "error": "Program requires input"
+            }
+        
+        return await self._run_prepared(prepared, input_data, temp_dir, on_event)
     
-    async def _execute(self, code: str, input_data: str, temp_dir: str) -> Dict[str, Any]:
-        raise NotImplementedError("Subclass must implement _execute method")
+    async def _prepare(self, code: str, temp_dir: str, on_event=None, **options) -> Dict[str, Any]:
+        """Проверка и компиляция кода. При успехе возвращает {"success": True, "code": ..., "meta": {...}}
+        и данные для _run_prepared, иначе — готовый ответ с ошибкой"""
+        raise NotImplementedError("Subclass must implement _prepare method")
+    
+    async def _run_prepared(self, prepared: Dict[str, Any], input_data: str, cwd: str,
+                            on_event=None) -> Dict[str, Any]:
+        """Один запуск подготовленной программы с рабочей папкой cwd"""
+        raise NotImplementedError("Subclass must implement _run_prepared method")
+    
+    async def check(self, code: str) -> List[Dict[str, Any]]:
+        """Быстрая проверка синтаксиса без сборки и запуска: список диагностик (см. diagnostic)"""
+        raise NotImplementedError("Subclass must implement check method")
     
     async def _run_process(self, cmd: list, input_data: str = "", 
-                          cwd: Optional[str] = None) -> Dict[str, Any]:
+                          cwd: Optional[str] = None,
+                          on_event: Optional[Callable[[str, bytes], None]] = None,
+                          limits: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Запуск процесса с лимитами ресурсов (по умолчанию self.limits).
+        
+        Процесс ожидается через wait4, поэтому в результат попадают cpuTime/userTime/systemTime —
+        фактическое время CPU, а не время на часах — и пик памяти (memory) из cgroup запуска.
+        """
+        limits = self.limits if limits is None else limits
+        process = None
+        reaped = False
+        watcher = None
+        cgroup = job_cgroups.create(limits.get("processes"))
         try:
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=cwd
-            )
+            # ru_maxrss дочернего процесса не меньше RSS сервиса на момент fork
+            inherited_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            stdin_r, stdin_w = os.pipe()
+            stdout_r, stdout_w = os.pipe()
+            stderr_r, stderr_w = os.pipe()
+            try:
+                process = subprocess.Popen(
+                    cmd,
+                    stdin=stdin_r,
+                    stdout=stdout_w,
+                    stderr=stderr_w,
+                    cwd=cwd,
+                    start_new_session=True,
+                    preexec_fn=limit_resources(limits, cgroup)
+                )
+            except BaseException:
+                for fd in (stdin_w, stdout_r, stderr_r):
+                    os.close(fd)
+                raise
+            finally:
+                for fd in (stdin_r, stdout_w, stderr_w):
+                    os.close(fd)
             
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(input=input_data.encode() if input_data else None),
-                timeout=self.timeout
-            )
+            async def wait():
+                nonlocal reaped
+                returncode, usage = await wait_process(process.pid)
+                reaped = True
+                process.returncode = returncode
+                # Фоновые потомки держат вывод открытым — завершаем их вместе с программой,
+                # в том числе вышедших из её группы процессов
+                kill_group(process.pid)
+                if cgroup is not None:
+                    cgroup.kill()
+                return returncode, usage
             
-            stdout_str = stdout.decode('utf-8', errors='replace')[:self.max_output_size]
-            stderr_str = stderr.decode('utf-8', errors='replace')[:self.max_output_size]
+            # Вывод читается по частям: при превышении лимита процесс сразу убивается
+            truncated = []
+            def on_overflow():
+                truncated.append(True)
+                if not reaped:
+                    kill_group(process.pid)
             
-            if process.returncode != 0:
-                return {
-                    "success": False,
-                    "error": stderr_str or "Execution failed",
-                    "output": stdout_str
-                }
+            def on_quota_exceeded():
+                if not reaped:
+                    kill_group(process.pid)
+                if cgroup is not None:
+                    cgroup.kill()
+            
+            if cwd is not None:
+                # Рабочая папка может быть на tmpfs (в памяти) — объём проверяется во время работы
+                watcher = QuotaWatcher(cwd, self.workspaces.quota, on_quota_exceeded)
+            
+            io = asyncio.gather(
+                read_pipe(stdout_r, self.max_output_size, on_overflow, stream_to(on_event, "stdout")),
+                read_pipe(stderr_r, self.max_output_size, on_overflow, stream_to(on_event, "stderr")),
+                write_pipe(stdin_w, input_data.encode() if input_data else b""),
+                wait(),
+            )
+            try:
+                stdout, stderr, _, (returncode, usage) = await asyncio.wait_for(io, timeout=self.timeout)
+            except BaseException:
+                io.cancel()
+                await asyncio.gather(io, return_exceptions=True)
+                raise
             
+            if watcher is not None and watcher.exceeded:
+                result = self._quota_result(stdout)
+            else:
+                result = self._process_result(returncode, stdout, stderr, bool(truncated))
+            # Без cgroup ru_maxrss годится, только если пик выше унаследованного от сервиса
+            if cgroup is not None:
+                peak = cgroup.peak()
+            else:
+                peak = usage.ru_maxrss if usage.ru_maxrss > inherited_rss else None
+            result.update(usage_result(usage.ru_utime, usage.ru_stime, peak))
+            return result
+            
+        except asyncio.TimeoutError:
+            return self._timeout_result()
+        except Exception as e:
             return {
-                "success": True,
+                "success": False,
+                "error": f"Execution error: {str(e)}"
+            }
+        finally:
+            if watcher is not None:
+                watcher.stop()
+            # Таймаут или отмена задачи (клиент больше не ждёт) — не оставляем процесс
+            if process is not None and not reaped:
+                kill_group(process.pid)
+                asyncio.ensure_future(self._reap(process))
+            if cgroup is not None:
+                job_cgroups.release(cgroup)
+    
+    @staticmethod
+    async def _reap(process: subprocess.Popen):
+        try:
+            process.returncode, _ = await wait_process(process.pid)
+        except ChildProcessError:
+            pass
+    
+    def _process_result(self, returncode: int, stdout: bytes, stderr: bytes,
+                        truncated: bool = False) -> Dict[str, Any]:
+        stdout_str = stdout.decode('utf-8', errors='replace')
+        stderr_str = stderr.decode('utf-8', errors='replace')
+        
+        if truncated:
+            return {
+                "success": False,
+                "error": f"Output limit exceeded ({self.max_output_size} bytes)",
                 "output": stdout_str,
-                "error": stderr_str if stderr_str else None
+                "truncated": True
             }
-            
-        except asyncio.TimeoutError:
-            if 'process' in locals():
-                process.kill()
+        
+        # Превышены лимиты setrlimit: ядро завершает процесс сигналом
+        if returncode == -signal.SIGXCPU:
             return {
                 "success": False,
-                "error": f"Execution timeout ({self.timeout}s exceeded)"
+                "error": "CPU time limit exceeded",
+                "output": stdout_str,
+                "timedOut": True
             }
-        except Exception as e:
+        if returncode == -signal.SIGXFSZ:
             return {
                 "success": False,
-                "error": f"Execution error: {str(e)}"
+                "error": "File size limit exceeded",
+                "output": stdout_str,
+                "truncated": False
+            }
+        
+        if returncode != 0:
+            return {
+                "success": False,
+                "error": stderr_str or "Execution failed",
+                "output": stdout_str,
+                "truncated": False
             }
+        
+        return {
+            "success": True,
+            "output": stdout_str,
+            "error": stderr_str if stderr_str else None,
+            "truncated": False
+        }
+    
+    def _timeout_result(self) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": f"Execution timeout ({self.timeout}s exceeded)",
+            "timedOut": True
+        }
+    
+    def _quota_result(self, stdout: bytes = b"") -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": f"Workspace quota exceeded ({self.workspaces.quota} bytes)",
+            "output": stdout.decode('utf-8', errors='replace'),
+            "truncated": False
+        }
     
     def _sanitize_code(self, code: str) -> str:
         # Базовая очистка кода
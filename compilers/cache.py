@@ -0,0 +1,208 @@
+import atexit, os, shutil, hashlib, uuid, time
+
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def content_key(*parts: str) -> str:
+    """Хеш содержимого: части разделяются нулевым байтом, чтобы не склеивались"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8", errors="replace"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def copy_file(source: str, dest: str, mode: int = 0o755) -> str:
+    """Копирует source в файл dest и возвращает sha256 записанного"""
+    digest = hashlib.sha256()
+    with open(source, "rb") as src, open(dest, "wb") as dst:
+        os.fchmod(dst.fileno(), mode)
+        while True:
+            chunk = src.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+
+class BinaryCache:
+    """Дисковый кеш скомпилированных файлов с LRU-вытеснением по размеру.
+
+    Программы запускаются от того же пользователя, что и сервис, и могут переписать файлы
+    кеша. Поэтому для каждой записи в памяти хранится sha256 содержимого: get() сверяет его
+    при копировании в рабочую папку, а испорченную запись вытесняет.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Ключ -> (размер, sha256 содержимого)
+        self.entries: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        self._drop_stale()
+        # Своя папка у каждого процесса: хеши записей известны только ему
+        self.cache_dir = os.path.join(cache_dir, str(os.getpid()))
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, mode=0o700)
+        atexit.register(self.close)
+
+    def _drop_stale(self):
+        # Записи завершившихся процессов проверить не с чем — удаляем
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.isdigit():
+                try:
+                    os.kill(int(name), 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except OSError:
+                    continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def close(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.entries.clear()
+        self.bytes_used = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str, dest: str) -> bool:
+        """Кладёт закешированный файл в dest; False, если записи нет или она испорчена"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False
+
+        try:
+            # Сверяется то, что записано в dest: подмена файла после проверки не поможет
+            digest = copy_file(self._path(key), dest)
+        except OSError:
+            digest = None
+        if digest != entry[1]:
+            # Файл пропал или изменён — забываем запись
+            self._discard(key)
+            if digest is not None:
+                self.rejected += 1
+                os.remove(dest)
+            self.misses += 1
+            return False
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True
+
+    def put(self, key: str, source: str):
+        """Сохраняет файл source в кеш под ключом key"""
+        size = os.path.getsize(source)
+        if size > self.max_bytes:
+            return
+
+        tmp_path = os.path.join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        digest = copy_file(source, tmp_path)
+        os.replace(tmp_path, self._path(key))
+
+        if key in self.entries:
+            self.bytes_used -= self.entries.pop(key)[0]
+        self.entries[key] = (size, digest)
+        self.bytes_used += size
+        self._evict()
+
+    def _discard(self, key: str):
+        self.bytes_used -= self.entries.pop(key)[0]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self.bytes_used > self.max_bytes and self.entries:
+            self._discard(next(iter(self.entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "entries": len(self.entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class ResultCache:
+    """Кеш результатов выполнения в памяти: TTL + LRU, ограничен по объёму"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl: float = 300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _estimate_size(result: Dict[str, Any]) -> int:
+        return sum(len(str(key)) + len(str(value)) for key, value in result.items())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, size, result = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            self.bytes_used -= size
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(result)
+
+    def put(self, key: str, result: Dict[str, Any]):
+        size = self._estimate_size(result)
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.bytes_used -= self.entries.pop(key)[1]
+        self.entries[key] = (time.time() + self.ttl, size, dict(result))
+        self.bytes_used += size
+
+        while self.bytes_used > self.max_bytes and self.entries:
+            _, (_, old_size, _) = self.entries.popitem(last=False)
+            self.bytes_used -= old_size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+        }
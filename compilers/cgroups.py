@@ -0,0 +1,239 @@
+import asyncio, atexit, os, signal, time
+
+from typing import Dict, Any, List, Optional
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+# Делегированная сервису cgroup v2 (например, systemd Delegate=yes); по умолчанию — своя cgroup
+CGROUP_PARENT = os.environ.get("COMPILEHUB_CGROUP")
+CGROUP_CONTROLLERS = ["memory", "pids"]
+# Файл с пиком потребления памяти: cgroup v2 / v1
+PEAK_FILES = {2: "memory.peak", 1: "memory.max_usage_in_bytes"}
+CGROUP_REMOVE_RETRIES = 40
+CGROUP_REMOVE_INTERVAL = 0.05
+
+
+def own_cgroup(controller: Optional[str]) -> Optional[str]:
+    """Путь cgroup текущего процесса из /proc/self/cgroup (controller None — cgroup v2)"""
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                _, controllers, path = line.rstrip("\n").split(":", 2)
+                names = controllers.split(",") if controllers else []
+                if (controller is None and not names) or controller in names:
+                    return path
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def write_file(path: str, value: str):
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.write(fd, value.encode())
+    finally:
+        os.close(fd)
+
+
+class JobCgroup:
+    """cgroup одного запуска: по директории на иерархию (в v1 у каждого контроллера своя)"""
+
+    def __init__(self, paths: List[str], peak_file: str):
+        self.paths = paths
+        self.peak_file = peak_file
+        # Пути заранее: join() вызывается в дочернем процессе между fork и exec
+        self.procs = [os.path.join(path, "cgroup.procs").encode() for path in paths]
+
+    def join(self):
+        """Переводит текущий процесс в cgroup запуска; потомки наследуют её сами"""
+        for procs in self.procs:
+            write_file(procs, "0")
+
+    def peak(self) -> Optional[int]:
+        """Пик потребления памяти в килобайтах"""
+        try:
+            with open(self.peak_file) as f:
+                return int(f.read()) // 1024
+        except (OSError, ValueError):
+            return None
+
+    def kill(self):
+        # Процессы, вышедшие из группы программы (setsid), в cgroup всё равно остаются
+        for path in self.paths:
+            try:
+                with open(os.path.join(path, "cgroup.procs")) as f:
+                    pids = [int(line) for line in f if line.strip()]
+            except (OSError, ValueError):
+                continue
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+    def remove(self) -> bool:
+        removed = True
+        for path in self.paths:
+            try:
+                os.rmdir(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                removed = False
+        return removed
+
+
+class CgroupManager:
+    """Создаёт cgroup на каждый запуск: из неё берётся пик памяти программы,
+    а pids.max ограничивает число её процессов и потоков.
+
+    Нужны права на запись в иерархию cgroup (root или делегированное поддерево).
+    Если их нет, create() возвращает None: пик памяти не известен, число процессов не ограничено.
+    """
+
+    def __init__(self, root: str = CGROUP_ROOT, controllers: Optional[List[str]] = None):
+        self.root = root
+        self.controllers = controllers or CGROUP_CONTROLLERS
+        self.version: Optional[int] = None
+        self.bases: List[str] = []
+        # Базовая директория для каждого контроллера (в v2 — одна на все)
+        self.hierarchies: Dict[str, str] = {}
+        self.ready: Optional[bool] = None
+        self.created = 0
+        self.failed = 0
+        self.leaked = 0
+        self.sequence = 0
+
+    def _make_base(self, parent: str) -> Optional[str]:
+        if not os.path.isdir(parent):
+            return None
+        base = os.path.join(parent, f"compilehub_{os.getpid()}")
+        try:
+            os.mkdir(base)
+        except FileExistsError:
+            pass
+        except OSError:
+            return None
+        self.bases.append(base)
+        return base
+
+    def _setup_v2(self) -> bool:
+        parent = CGROUP_PARENT or os.path.join(self.root, (own_cgroup(None) or "/").lstrip("/"))
+        base = self._make_base(parent)
+        if base is None:
+            return False
+        try:
+            with open(os.path.join(base, "cgroup.controllers")) as f:
+                available = f.read().split()
+            if not set(self.controllers) <= set(available):
+                return False
+            # В base процессов нет, поэтому контроллеры можно включить для дочерних cgroup
+            write_file(os.path.join(base, "cgroup.subtree_control"),
+                       " ".join("+" + name for name in self.controllers))
+        except OSError:
+            return False
+        self.hierarchies = {controller: base for controller in self.controllers}
+        self.version = 2
+        return True
+
+    def _setup_v1(self) -> bool:
+        for controller in self.controllers:
+            own = own_cgroup(controller)
+            if own is None:
+                return False
+            base = self._make_base(os.path.join(self.root, controller, own.lstrip("/")))
+            if base is None:
+                return False
+            self.hierarchies[controller] = base
+        self.version = 1
+        return True
+
+    def _setup(self) -> bool:
+        if os.path.exists(os.path.join(self.root, "cgroup.controllers")):
+            ready = self._setup_v2()
+        elif all(os.path.exists(os.path.join(self.root, controller, "cgroup.procs"))
+                 for controller in self.controllers):
+            ready = self._setup_v1()
+        else:
+            ready = False
+        if not ready:
+            self.close()
+            return False
+        atexit.register(self.close)
+        return True
+
+    def create(self, processes: Optional[int] = None) -> Optional[JobCgroup]:
+        """cgroup для одного запуска; processes — лимит процессов и потоков (pids.max)"""
+        if self.ready is None:
+            self.ready = self._setup()
+        if not self.ready:
+            return None
+
+        self.sequence += 1
+        name = f"job_{self.sequence}"
+        paths = []
+        try:
+            for base in self.bases:
+                path = os.path.join(base, name)
+                os.mkdir(path)
+                paths.append(path)
+            if processes is not None:
+                write_file(os.path.join(self.hierarchies["pids"], name, "pids.max"), str(processes))
+        except OSError:
+            self.failed += 1
+            JobCgroup(paths, "").remove()
+            return None
+        self.created += 1
+        return JobCgroup(paths, os.path.join(self.hierarchies["memory"], name, PEAK_FILES[self.version]))
+
+    def release(self, cgroup: JobCgroup):
+        """Удаляет cgroup запуска; оставшиеся в ней процессы убиваются"""
+        if cgroup.remove():
+            return
+        cgroup.kill()
+        asyncio.ensure_future(self._remove_later(cgroup))
+
+    async def _remove_later(self, cgroup: JobCgroup):
+        # Убитые процессы покидают cgroup, только когда их дождётся родитель
+        for _ in range(CGROUP_REMOVE_RETRIES):
+            await asyncio.sleep(CGROUP_REMOVE_INTERVAL)
+            if cgroup.remove():
+                return
+            cgroup.kill()
+        self.leaked += 1
+
+    def close(self):
+        for base in self.bases:
+            try:
+                leftover = [JobCgroup([os.path.join(base, name)], "") for name in os.listdir(base)
+                            if os.path.isdir(os.path.join(base, name))]
+            except OSError:
+                continue
+            # Убитые процессы остаются в cgroup, пока их не дождётся родитель (часто — init)
+            for _ in range(CGROUP_REMOVE_RETRIES):
+                for cgroup in leftover:
+                    cgroup.kill()
+                leftover = [cgroup for cgroup in leftover if not cgroup.remove()]
+                if not leftover:
+                    break
+                time.sleep(CGROUP_REMOVE_INTERVAL)
+            try:
+                os.rmdir(base)
+            except OSError:
+                pass
+        self.bases = []
+        self.hierarchies = {}
+        self.ready = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "available": bool(self.ready),
+            "version": self.version,
+            "controllers": list(self.controllers),
+            "created": self.created,
+            "failed": self.failed,
+            "leaked": self.leaked,
+        }
+
+
+# Общий для процесса: cgroup запусков создаются в одной базовой директории
+job_cgroups = CgroupManager()
@@ -1,11 +1,290 @@
-import os
-from compilers.base import CompilerBase
+import asyncio, atexit, os, re, shutil, subprocess, tempfile, time, uuid
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+from compilers.base import CompilerBase, diagnostic
+from compilers.cache import BinaryCache, content_key
+from telemetry import span
+
+# Профили оптимизации: fast — быстрая сборка, optimized — как раньше (-O2),
+# auto — fast, пока программа не начнёт работать дольше порога
+CPP_PROFILES = {
+    "fast": ["-std=c++17", "-O0", "-Wall"],
+    "optimized": ["-std=c++17", "-O2", "-Wall"],
+}
+PROFILES = ("fast", "optimized", "auto")
+# Без явного профиля — прежнее поведение: программа под -O0 может не уложиться в таймаут
+DEFAULT_PROFILE = "optimized"
+AUTO_OPTIMIZE_THRESHOLD = 0.5  # секунды выполнения
+AUTO_HOT_SOURCES_LIMIT = 10000
+# Лимиты для g++: cc1plus с PCH и -O2 требует заметно больше памяти, чем программа
+COMPILE_LIMITS = {
+    "cpu": 30,
+    "memory": 2 * 1024 * 1024 * 1024,
+    "processes": 64,
+    "file_size": 256 * 1024 * 1024,
+}
+BINARY_CACHE_DIR = os.path.join(tempfile.gettempdir(), "compilehub_bin_cache")
+BINARY_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Предкомпилированные заголовки для самых частых #include
+PCH_HEADERS = ["bits/stdc++.h", "iostream"]
+PCH_ROOT = os.path.join(tempfile.gettempdir(), "compilehub_pch")
+PCH_BUILD_TIMEOUT = 120
+
+FIRST_INCLUDE_RE = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+
+# Проверка синтаксиса: флаги профиля fast, чтобы подходили его PCH
+CHECK_PROFILE = "fast"
+DIAGNOSTIC_RE = re.compile(r'^<stdin>:(\d+):(\d+): (fatal error|error|warning|note): (.*)$', re.MULTILINE)
+
+
+@lru_cache(maxsize=None)
+def _toolchain_version(path: str, mtime: float) -> str:
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10)
+        return result.stdout.split("\n")[0].strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def toolchain_version() -> str:
+    # Версия g++ входит в ключи кешей: после обновления старые бинарники и PCH
+    # не используются. Бинарник перечитывается только при смене его mtime
+    path = shutil.which("g++")
+    if not path:
+        return "unknown"
+    try:
+        path = os.path.realpath(path)
+        return f"{_toolchain_version(path, os.stat(path).st_mtime)} ({path})"
+    except OSError:
+        return "unknown"
+
+
+def first_include(code: str) -> Optional[str]:
+    match = FIRST_INCLUDE_RE.search(code)
+    return match.group(1) if match else None
+
+
+class PrecompiledHeaders:
+    """Сборка и выдача PCH: отдельный каталог на каждый набор флагов и версию g++.
+
+    Каталог PCH стоит в пути поиска заголовков, а программы могут в него писать. Поэтому
+    перед каждым использованием каталог сверяется с тем, что собрал сам сервис: .gch — по
+    inode, размеру и времени изменения, лишние файлы (подложенные заголовки) не допускаются.
+    Не прошедший проверку каталог удаляется и собирается заново.
+    """
+
+    def __init__(self, root: str, headers: List[str]):
+        os.makedirs(root, mode=0o700, exist_ok=True)
+        self._drop_dead(root)
+        # Своя папка у каждого процесса: собранное другими проверить не с чем
+        self.root = os.path.join(root, str(os.getpid()))
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, mode=0o700)
+        atexit.register(shutil.rmtree, self.root, True)
+        self.headers = headers
+        self.builds: Dict[str, asyncio.Task] = {}
+        # Путь .gch -> (inode, размер, mtime, ctime) на момент сборки
+        self.fingerprints: Dict[str, tuple] = {}
+        self.built = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _drop_dead(root: str):
+        for name in os.listdir(root):
+            if name.isdigit():
+                try:
+                    os.kill(int(name), 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except OSError:
+                    continue
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    @staticmethod
+    def _fingerprint(path: str) -> tuple:
+        stat = os.stat(path, follow_symlinks=False)
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+
+    def directory(self, flags: List[str]) -> str:
+        return os.path.join(self.root, content_key(" ".join(flags), toolchain_version())[:16])
+
+    def _verified(self, directory: str) -> bool:
+        # Допустимы только собранные .gch, метка версии и их подкаталоги (bits/)
+        for path, dirs, files in os.walk(directory):
+            for name in files:
+                file_path = os.path.join(path, name)
+                if file_path == os.path.join(directory, ".toolchain"):
+                    continue
+                try:
+                    if self.fingerprints.get(file_path) != self._fingerprint(file_path):
+                        return False
+                except OSError:
+                    return False
+            for name in dirs:
+                if os.path.islink(os.path.join(path, name)):
+                    return False
+        return True
+
+    def include_args(self, flags: List[str]) -> List[str]:
+        """Флаги для g++: каталог с .gch ищется раньше системных заголовков"""
+        directory = self.directory(flags)
+        if not any(os.path.join(directory, header + ".gch") in self.fingerprints
+                   for header in self.headers):
+            return []
+        if not self._verified(directory):
+            self.rejected += 1
+            self._drop(directory)
+            return []
+        return ["-I", directory]
+
+    def _drop(self, directory: str):
+        shutil.rmtree(directory, ignore_errors=True)
+        prefix = directory + os.sep
+        for target in [target for target in self.fingerprints if target.startswith(prefix)]:
+            del self.fingerprints[target]
+
+    def ensure(self, flags: List[str], headers: Optional[List[str]] = None):
+        """Запускает фоновую сборку недостающих PCH (не блокирует запрос)"""
+        directory = self.directory(flags)
+        for header in headers if headers is not None else self.headers:
+            if header not in self.headers:
+                continue
+            target = os.path.join(directory, header + ".gch")
+            if target in self.builds or target in self.fingerprints:
+                continue
+            self.builds[target] = asyncio.ensure_future(self._build(flags, header, target))
+
+    async def _build(self, flags: List[str], header: str, target: str):
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            self._drop_stale()
+            with open(os.path.join(self.directory(flags), ".toolchain"), "w") as f:
+                f.write(toolchain_version())
+
+            # g++ не собирает PCH из stdin — пишем заглушку во временный файл.
+            # Недостроенный .gch лежит вне каталогов из пути поиска заголовков
+            tmp_target = os.path.join(self.root, f".build-{uuid.uuid4().hex}.gch")
+            stub = os.path.join(self.root, f".stub-{uuid.uuid4().hex}.hpp")
+            with open(stub, "w") as f:
+                f.write(f"#include <{header}>\n")
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    "g++", "-x", "c++-header", stub, "-o", tmp_target, *flags,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=PCH_BUILD_TIMEOUT)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+            finally:
+                os.remove(stub)
+
+            if process.returncode == 0:
+                # Атомарная подмена: компиляции не увидят недописанный .gch
+                os.replace(tmp_target, target)
+                self.fingerprints[target] = self._fingerprint(target)
+                self.built += 1
+            else:
+                self.failed += 1
+                if os.path.exists(tmp_target):
+                    os.remove(tmp_target)
+        except OSError:
+            self.failed += 1
+        finally:
+            self.builds.pop(target, None)
+
+    def _drop_stale(self):
+        # Каталоги, собранные другой версией g++, больше не пригодны
+        current = toolchain_version()
+        for name in os.listdir(self.root):
+            stamp = os.path.join(self.root, name, ".toolchain")
+            try:
+                with open(stamp) as f:
+                    stale = f.read() != current
+            except OSError:
+                continue
+            if stale:
+                self._drop(os.path.join(self.root, name))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "headers": list(self.headers),
+            "built": self.built,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "building": len(self.builds),
+        }
+
 
 class CppCompiler(CompilerBase):
     def __init__(self):
         super().__init__("cpp", timeout=5)
+        self.binary_cache = BinaryCache(BINARY_CACHE_DIR, BINARY_CACHE_MAX_BYTES)
+        self.pch = PrecompiledHeaders(PCH_ROOT, PCH_HEADERS)
+        # Программы, которые в режиме auto работали дольше порога
+        self.hot_sources: "OrderedDict[str, bool]" = OrderedDict()
+    
+    def warm_up(self):
+        """Сборка PCH в фоне при старте сервиса"""
+        for flags in CPP_PROFILES.values():
+            self.pch.ensure(flags)
+    
+    def _resolve_profile(self, profile: Optional[str], source_key: str) -> str:
+        profile = profile or DEFAULT_PROFILE
+        if profile != "auto":
+            return profile
+        return "optimized" if source_key in self.hot_sources else "fast"
+    
+    def _record_run_time(self, source_key: str, run_time: float):
+        if run_time < AUTO_OPTIMIZE_THRESHOLD:
+            return
+        self.hot_sources[source_key] = True
+        self.hot_sources.move_to_end(source_key)
+        while len(self.hot_sources) > AUTO_HOT_SOURCES_LIMIT:
+            self.hot_sources.popitem(last=False)
+        
+    async def compile_and_run_batch(self, code: str, cases: List[Dict[str, Any]], concurrency: int = 4,
+                                    stop_on_failure: bool = False, **options) -> Dict[str, Any]:
+        # Вердикты не должны зависеть от того, успел ли auto узнать программу:
+        # бинарник прогоняется на всех тестах, и -O2 окупается сразу
+        if options.get("profile") == "auto":
+            options["profile"] = "optimized"
+        return await super().compile_and_run_batch(code, cases, concurrency, stop_on_failure, **options)
         
-    async def _execute(self, code: str, input_data: str, temp_dir: str):
+    async def check(self, code: str):
+        # g++ -fsyntax-only: только разбор и семантика, без кодогенерации и бинарника
+        flags = CPP_PROFILES[CHECK_PROFILE]
+        header = first_include(code)
+        if header:
+            self.pch.ensure(flags, [header])
+        result = await self._run_process(
+            ["g++", "-fsyntax-only", "-x", "c++", "-"] + self.pch.include_args(flags) + flags,
+            input_data=code,
+            limits=COMPILE_LIMITS
+        )
+        if result.get("timedOut"):
+            return [diagnostic(None, None, "error", result["error"])]
+        
+        stderr = result.get("error") or ""
+        diagnostics = [
+            diagnostic(int(line), int(column), "error" if "error" in severity else severity, message)
+            for line, column, severity, message in DIAGNOSTIC_RE.findall(stderr)
+        ]
+        if not result["success"] and not any(d["severity"] == "error" for d in diagnostics):
+            # Ошибка без позиции в коде (например, в заголовке)
+            diagnostics.append(diagnostic(None, None, "error", stderr.strip() or "Syntax check failed"))
+        return diagnostics
+    
+    async def _prepare(self, code: str, temp_dir: str, profile: Optional[str] = None,
+                       on_event=None, **options):
         code = self._sanitize_code(code)
         if not code:
             return {
@@ -16,57 +295,103 @@ class CppCompiler(CompilerBase):
         source_file = os.path.join(temp_dir, "main.cpp")
         exe_file = os.path.join(temp_dir, "main")
         
-        # Записываем код
-        with open(source_file, 'w') as f:
-            f.write(code)
+        source_key = content_key(code)
+        requested_profile = profile or DEFAULT_PROFILE
+        profile = self._resolve_profile(profile, source_key)
+        flags = CPP_PROFILES[profile]
+        cache_key = content_key(code, " ".join(flags), toolchain_version())
         
-        # Компиляция
-        compile_result = await self._run_process(
-            ["g++", "-o", exe_file, source_file, "-std=c++17", "-O2", "-Wall"],
-            cwd=temp_dir
-        )
+        # Повторная отправка того же кода — компиляцию пропускаем
+        compile_start = time.time()
+        with span("cache"):
+            cached = self.binary_cache.get(cache_key, exe_file)
+        if cached:
+            compile_result = {"success": True}
+        else:
+            # Записываем код
+            with span("write"):
+                with open(source_file, 'w') as f:
+                    f.write(code)
+            
+            # Заголовок из набора PCH — используем его (или собираем к следующему разу)
+            header = first_include(code)
+            if header:
+                self.pch.ensure(flags, [header])
+            
+            # Компиляция
+            with span("compile"):
+                compile_result = await self._run_process(
+                    ["g++", "-o", exe_file, source_file] + self.pch.include_args(flags) + flags,
+                    cwd=temp_dir,
+                    limits=COMPILE_LIMITS
+                )
+            
+            if compile_result["success"]:
+                with span("cache"):
+                    try:
+                        self.binary_cache.put(cache_key, exe_file)
+                    except OSError:
+                        pass
+        compile_time = time.time() - compile_start
+        if on_event is not None:
+            # Диагностика компилятора уходит клиенту до запуска программы
+            on_event("compile", (compile_result.get("error") or "").encode())
         
         if not compile_result["success"]:
             # Парсинг ошибок компиляции
-            error_lines = compile_result["error"].split('\n')
-            for line in error_lines:
-                if "error:" in line:
-                    parts = line.split(':')
-                    if len(parts) >= 3:
-                        try:
-                            line_num = int(parts[1])
-                            message = ':'.join(parts[3:]).strip()
-                            return {
-                                "success": False,
-                                "error": "Compilation error",
-                                "details": {
-                                    "line": line_num,
-                                    "message": message
+            with span("parse"):
+                error_lines = compile_result["error"].split('\n')
+                for line in error_lines:
+                    if "error:" in line:
+                        parts = line.split(':')
+                        if len(parts) >= 3:
+                            try:
+                                line_num = int(parts[1])
+                                message = ':'.join(parts[3:]).strip()
+                                return {
+                                    "success": False,
+                                    "error": "Compilation error",
+                                    "details": {
+                                        "line": line_num,
+                                        "message": message
+                                    },
+                                    "profile": profile,
+                                    "compileTime": compile_time
                                 }
-                            }
-                        except:
-                            pass
+                            except ValueError:
+                                pass
             
             return {
                 "success": False,
-                "error": compile_result["error"]
+                "error": compile_result["error"],
+                "profile": profile,
+                "compileTime": compile_time
             }
         
-        # Проверка на требования ввода
-        input_check = self._check_input_requirements(code)
-        if input_check["requiresInput"] and not input_data:
-            return {
-                "success": False,
-                "requiresInput": True,
-                "inputDescription": input_check["inputDescription"],
-                "error": "Program requires input"
+        return {
+            "success": True,
+            "code": code,
+            "exe": exe_file,
+            "source_key": source_key,
+            "auto": requested_profile == "auto",
+            "meta": {
+                "profile": profile,
+                "compileTime": compile_time
             }
-        
+        }
+    
+    async def _run_prepared(self, prepared, input_data: str, cwd: str, on_event=None):
         # Запуск
-        run_result = await self._run_process(
-            [exe_file],
-            input_data=input_data,
-            cwd=temp_dir
-        )
+        run_start = time.time()
+        with span("run"):
+            run_result = await self._run_process(
+                [prepared["exe"]],
+                input_data=input_data,
+                cwd=cwd,
+                on_event=on_event
+            )
+        if prepared["auto"]:
+            self._record_run_time(prepared["source_key"], time.time() - run_start)
         
-        return run_result
\ No newline at end of file
+        run_result.update(prepared["meta"])
+        return run_result
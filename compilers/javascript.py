@@ -1,88 +1,147 @@
-import os
-from compilers.base import CompilerBase
+import os, re, json, asyncio
+from compilers.base import CompilerBase, usage_fields, diagnostic
+from compilers.pool import NodeRunnerPool, PoolUnavailable, NODE_FLAGS
+from telemetry import span
+
+# Запасные процессы node, запущенные заранее: каждый выполняет одну задачу и заменяется
+NODE_POOL_SIZE = os.cpu_count() or 2
+# V8 резервирует больше гигабайта адресного пространства — лимит памяти для node выше,
+# а саму кучу ограничивает --max-old-space-size
+NODE_MEMORY_LIMIT = 2 * 1024 * 1024 * 1024
+
+# Члены process, которые есть в контексте прогретого node (node_runner.js); код, которому нужно
+# что-то ещё (process.stdin, process.on, сам объект process), выполняется обычным node
+WARM_PROCESS_MEMBERS = {"argv", "env", "platform", "version", "versions", "hrtime", "memoryUsage",
+                        "nextTick", "exit", "stdout", "stderr"}
+PROCESS_RE = re.compile(r'\bprocess\b(?:\s*\.\s*(\w+))?')
+
+# Ответ node --check: "[stdin]:3", строка кода, "^" под позицией, затем "SyntaxError: ..."
+CHECK_LOCATION_RE = re.compile(r'^\[stdin\]:(\d+)$')
+CHECK_MESSAGE_RE = re.compile(r'^\w*Error: ')
 
 class JavaScriptCompiler(CompilerBase):
     def __init__(self):
         super().__init__("javascript", timeout=5)
-        
-    async def _execute(self, code: str, input_data: str, temp_dir: str):
-        code = self._sanitize_code(code)
-        if not code:
+        self.limits["memory"] = NODE_MEMORY_LIMIT
+        self.pool = NodeRunnerPool(NODE_POOL_SIZE, self.limits)
+    
+    def warm_up(self):
+        """Запуск процессов node в фоне при старте сервиса"""
+        asyncio.ensure_future(self.pool.warm_up())
+    
+    async def _run_warm(self, code: str, input_data: str, temp_dir: str, on_event=None):
+        input_lines = input_data.strip().split("\n") if input_data else []
+        try:
+            with span("run"):
+                returncode, stdout, stderr, truncated, usage = await self.pool.run(
+                    code, input_lines, self.timeout, self.max_output_size, on_event
+                )
+        except asyncio.TimeoutError:
+            return self._timeout_result()
+        except PoolUnavailable:
+            return await self._run_cold(code, input_data, temp_dir, on_event)
+        except Exception as e:
             return {
                 "success": False,
-                "error": "Code contains forbidden operations"
+                "error": f"Execution error: {str(e)}"
             }
-        
+        result = self._process_result(returncode, stdout.encode(), stderr.encode(), truncated)
+        result.update(usage)
+        return result
+    
+    async def _run_cold(self, code: str, input_data: str, temp_dir: str, on_event=None):
         source_file = os.path.join(temp_dir, "main.js")
         
-        # Обёртка для обработки ввода в Node.js
+        # Обёртка для readLine(): одной строкой, чтобы не сдвигать номера строк в ошибках
         if input_data:
-            wrapped_code = f"""
-            const readline = require('readline');
-            const rl = readline.createInterface({{
-                input: process.stdin,
-                output: process.stdout
-            }});
-
-            let inputLines = """ + repr(input_data.strip().split("\n")) + """;
-            let currentLine = 0;
-
-            global.readLine = function() {{
-                if (currentLine < inputLines.length) {{
-                    return inputLines[currentLine++];
-                }}
-                return '';
-            }};
-
-            {code}
-
-            rl.close();
-            """
+            wrapped_code = (
+                "global.readLine = (() => { const lines = "
+                + json.dumps(input_data.strip().split("\n"))
+                + "; let current = 0; return () => (current < lines.length ? lines[current++] : ''); })(); "
+                + code
+            )
         else:
             wrapped_code = code
         
         # Записываем код
-        with open(source_file, 'w') as f:
-            f.write(wrapped_code)
+        with span("write"):
+            with open(source_file, 'w') as f:
+                f.write(wrapped_code)
+        
+        # Запуск Node.js
+        with span("run"):
+            return await self._run_process(
+                ["node", *NODE_FLAGS, source_file],
+                cwd=temp_dir,
+                on_event=on_event
+            )
         
-        # Проверка на требования ввода
-        input_check = self._check_input_requirements(code)
-        if input_check["requiresInput"] and not input_data:
+    async def check(self, code: str):
+        # node --check только компилирует скрипт; код читается из stdin, файл не пишется
+        result = await self._run_process(["node", *NODE_FLAGS, "--check"], input_data=code)
+        if result["success"]:
+            return []
+        if result.get("timedOut"):
+            return [diagnostic(None, None, "error", result["error"])]
+        
+        lines = (result.get("error") or "").split("\n")
+        line_num = column = None
+        message = None
+        for i, line in enumerate(lines):
+            location = CHECK_LOCATION_RE.match(line)
+            if location and line_num is None:
+                line_num = int(location.group(1))
+                if i + 2 < len(lines) and "^" in lines[i + 2]:
+                    column = lines[i + 2].index("^") + 1
+            elif message is None and CHECK_MESSAGE_RE.match(line):
+                message = line.strip()
+        return [diagnostic(line_num, column, "error", message or result.get("error") or "Syntax check failed")]
+    
+    async def _prepare(self, code: str, temp_dir: str, on_event=None, **options):
+        code = self._sanitize_code(code)
+        if not code:
             return {
                 "success": False,
-                "requiresInput": True,
-                "inputDescription": input_check["inputDescription"],
-                "error": "Program requires input"
+                "error": "Code contains forbidden operations"
             }
         
-        # Запуск Node.js
-        run_result = await self._run_process(
-            ["node", source_file],
-            cwd=temp_dir
-        )
+        return {"success": True, "code": code, "meta": {}}
+    
+    async def _run_prepared(self, prepared, input_data: str, cwd: str, on_event=None):
+        code = prepared["code"]
+        
+        # Самодостаточный код выполняется в прогретом node, с require — как раньше
+        if "require(" in code or any(match.group(1) not in WARM_PROCESS_MEMBERS
+                                     for match in PROCESS_RE.finditer(code)):
+            run_result = await self._run_cold(code, input_data, cwd, on_event)
+        else:
+            run_result = await self._run_warm(code, input_data, cwd, on_event)
         
         # Парсинг ошибок JavaScript
-        if not run_result["success"] and run_result.get("error"):
-            error_lines = run_result["error"].split('\n')
-            for line in error_lines:
-                if ".js:" in line:
-                    try:
-                        parts = line.split(':')
-                        if len(parts) >= 2:
-                            line_num = int(parts[1])
-                            # Поиск сообщения об ошибке
-                            for err_line in error_lines:
-                                if "Error:" in err_line or "error:" in err_line:
-                                    message = err_line.strip()
-                                    return {
-                                        "success": False,
-                                        "error": "Runtime error",
-                                        "details": {
-                                            "line": line_num,
-                                            "message": message
+        with span("parse"):
+            if not run_result["success"] and run_result.get("error"):
+                error_lines = run_result["error"].split('\n')
+                for line in error_lines:
+                    if ".js:" in line:
+                        try:
+                            parts = line.split(':')
+                            if len(parts) >= 2:
+                                line_num = int(parts[1])
+                                # Поиск сообщения об ошибке
+                                for err_line in error_lines:
+                                    if "Error:" in err_line or "error:" in err_line:
+                                        message = err_line.strip()
+                                        return {
+                                            "success": False,
+                                            "error": "Runtime error",
+                                            "details": {
+                                                "line": line_num,
+                                                "message": message
+                                            },
+                                            **usage_fields(run_result)
                                         }
-                                    }
-                    except:
-                        pass
+                        except:
+                            pass
+        
         
         return run_result
\ No newline at end of file
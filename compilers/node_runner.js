@@ -0,0 +1,246 @@
+// Заранее запущенный исполнитель JavaScript для JavaScriptCompiler.
+//
+// Процесс выполняет ровно одну задачу и после неё заменяется новым: vm-контекст
+// даёт программе console, readLine и таймеры, но не изолирует её от процесса
+// (через конструкторы переданных объектов доступен настоящий process).
+// Задача приходит JSON-строкой на stdin, ответы пишутся JSON-строками в stdout:
+//   <- {"type": "ready"}
+//   -> {"id": 1, "code": "...", "input": ["line", ...], "timeout": 5000, "maxOutput": 1000000}
+//   <- {"type": "stdout" | "stderr", "id": 1, "data": "..."}
+//   <- {"type": "exit", "id": 1, "code": 0, "truncated": false, "userTime": 0.01, "systemTime": 0}
+// Время CPU (секунды) — приращение process.cpuUsage() за время задачи
+'use strict';
+
+const vm = require('vm');
+const util = require('util');
+const readline = require('readline');
+
+let current = null;
+let started = false;
+
+class ExitSignal {
+  constructor(code) {
+    this.code = code;
+  }
+}
+
+function send(message) {
+  process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+// Возвращает false, если лимит вывода превышен и задача завершена.
+// Лимит — на каждый поток отдельно, как при чтении вывода обычного процесса
+function emit(job, type, text) {
+  if (job.done) {
+    return false;
+  }
+  const room = job.maxOutput - job.written[type];
+  let data = Buffer.from(text);
+  const overflow = data.length > room;
+  if (overflow) {
+    data = data.subarray(0, Math.max(room, 0));
+  }
+  if (data.length > 0) {
+    job.written[type] += data.length;
+    send({ type, id: job.id, data: data.toString() });
+  }
+  if (overflow) {
+    job.truncated = true;
+    finish(job, 1);
+    return false;
+  }
+  return true;
+}
+
+// Для пользовательского кода: при превышении лимита выполнение прерывается
+function output(job, type, text) {
+  if (!emit(job, type, text)) {
+    throw new ExitSignal(1);
+  }
+}
+
+function formatError(err) {
+  if (err && typeof err.stack === 'string') {
+    // Кадры исполнителя и node:vm пользователю не нужны
+    return err.stack
+      .split('\n')
+      .filter((line) => !(line.trimStart().startsWith('at ') &&
+                          (line.includes(__filename) || line.includes('node:'))))
+      .join('\n') + '\n';
+  }
+  return 'Uncaught ' + util.inspect(err) + '\n';
+}
+
+function finish(job, code) {
+  if (job.done) {
+    return;
+  }
+  job.done = true;
+  for (const handle of job.timers) {
+    clearTimeout(handle);
+    clearInterval(handle);
+  }
+  job.timers.clear();
+  if (current === job) {
+    current = null;
+  }
+  const cpu = process.cpuUsage(job.cpu);
+  send({
+    type: 'exit',
+    id: job.id,
+    code,
+    truncated: job.truncated,
+    userTime: cpu.user / 1e6,
+    systemTime: cpu.system / 1e6,
+  });
+}
+
+function fail(job, err) {
+  if (err instanceof ExitSignal) {
+    finish(job, err.code);
+    return;
+  }
+  emit(job, 'stderr', formatError(err));
+  finish(job, 1);
+}
+
+function settle(job) {
+  // Программа завершена, когда не осталось таймеров (микрозадачи уже выполнены)
+  setImmediate(() => {
+    if (!job.done && job.timers.size === 0) {
+      finish(job, 0);
+    }
+  });
+}
+
+function invoke(job, callback, args) {
+  if (job.done) {
+    return;
+  }
+  try {
+    callback(...args);
+  } catch (err) {
+    fail(job, err);
+    return;
+  }
+  settle(job);
+}
+
+function createContext(job) {
+  let line = 0;
+  const readLine = () => (line < job.input.length ? job.input[line++] : '');
+  const write = (type) => (...args) => output(job, type, util.format(...args) + '\n');
+
+  const console = {
+    log: write('stdout'),
+    info: write('stdout'),
+    debug: write('stdout'),
+    table: write('stdout'),
+    dir: (value) => output(job, 'stdout', util.inspect(value) + '\n'),
+    error: write('stderr'),
+    warn: write('stderr'),
+    trace: write('stderr'),
+  };
+
+  const timers = job.timers;
+  const clear = (handle) => {
+    timers.delete(handle);
+    clearTimeout(handle);
+    clearInterval(handle);
+  };
+
+  return vm.createContext({
+    console,
+    readLine,
+    prompt: readLine,
+    setTimeout: (callback, ms, ...args) => {
+      const handle = setTimeout(() => {
+        timers.delete(handle);
+        invoke(job, callback, args);
+      }, ms);
+      timers.add(handle);
+      return handle;
+    },
+    setInterval: (callback, ms, ...args) => {
+      const handle = setInterval(() => invoke(job, callback, args), ms);
+      timers.add(handle);
+      return handle;
+    },
+    setImmediate: (callback, ...args) => {
+      const handle = setTimeout(() => {
+        timers.delete(handle);
+        invoke(job, callback, args);
+      }, 0);
+      timers.add(handle);
+      return handle;
+    },
+    clearTimeout: clear,
+    clearInterval: clear,
+    clearImmediate: clear,
+    queueMicrotask,
+    structuredClone,
+    TextEncoder,
+    TextDecoder,
+    URL,
+    URLSearchParams,
+    Buffer,
+    process: {
+      argv: ['node', 'main.js'],
+      env: {},
+      platform: process.platform,
+      version: process.version,
+      versions: process.versions,
+      hrtime: process.hrtime,
+      memoryUsage: process.memoryUsage,
+      nextTick: (callback, ...args) => queueMicrotask(() => invoke(job, callback, args)),
+      exit: (code) => {
+        throw new ExitSignal(code === undefined ? 0 : code);
+      },
+      stdout: { write: (text) => (output(job, 'stdout', String(text)), true) },
+      stderr: { write: (text) => (output(job, 'stderr', String(text)), true) },
+    },
+  });
+}
+
+function runJob(job) {
+  job.written = { stdout: 0, stderr: 0 };
+  job.truncated = false;
+  job.done = false;
+  job.timers = new Set();
+  job.cpu = process.cpuUsage();
+  current = job;
+
+  try {
+    const script = new vm.Script(job.code, { filename: 'main.js' });
+    script.runInContext(createContext(job), { timeout: job.timeout });
+  } catch (err) {
+    fail(job, err);
+    return;
+  }
+  settle(job);
+}
+
+process.on('uncaughtException', (err) => {
+  if (current) {
+    fail(current, err);
+  }
+});
+
+process.on('unhandledRejection', (reason) => {
+  if (current) {
+    fail(current, reason);
+  }
+});
+
+const input = readline.createInterface({ input: process.stdin });
+input.on('line', (line) => {
+  // Следующие задачи не принимаются: их видела бы программа предыдущего пользователя
+  if (started) {
+    return;
+  }
+  started = true;
+  runJob(JSON.parse(line));
+});
+input.on('close', () => process.exit(0));
+
+send({ type: 'ready' });
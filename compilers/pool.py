@@ -0,0 +1,441 @@
+import asyncio, json, os, signal, socket, time
+
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from compilers.base import read_pipe, write_pipe, stream_to, rlimits, usage_result, limit_resources
+from compilers.cgroups import JobCgroup, job_cgroups
+from compilers.workspace import QuotaWatcher, WorkspaceQuotaExceeded
+
+FORKSERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyforkserver.py")
+WORKER_START_TIMEOUT = 10
+
+NODE_RUNNER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "node_runner.js")
+NODE_RUNNER_LINE_LIMIT = 16 * 1024 * 1024
+# Куча V8 ограничивается флагом: адресного пространства node резервирует больше гигабайта
+NODE_HEAP_LIMIT_MB = 256
+NODE_FLAGS = [f"--max-old-space-size={NODE_HEAP_LIMIT_MB}"]
+
+
+class PoolUnavailable(Exception):
+    """Пул не смог принять задачу — можно запустить программу обычным способом"""
+
+
+class ForkServer:
+    """Прогретый процесс python3, который форкает программу на каждую задачу"""
+
+    def __init__(self):
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.sock: Optional[socket.socket] = None
+        self.jobs = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None and self.sock is not None
+
+    async def start(self):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                "python3", FORKSERVER_SCRIPT, str(child.fileno()),
+                pass_fds=(child.fileno(),),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+            )
+        except OSError:
+            parent.close()
+            raise
+        finally:
+            child.close()
+
+        parent.setblocking(False)
+        self.sock = parent
+        try:
+            message = await asyncio.wait_for(self._recv(), timeout=WORKER_START_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            self.close()
+            raise PoolUnavailable("forkserver did not start")
+        if not message.get("ready"):
+            self.close()
+            raise PoolUnavailable("forkserver did not start")
+
+    async def _recv(self) -> Dict[str, Any]:
+        data = await asyncio.get_running_loop().sock_recv(self.sock, 65536)
+        if not data:
+            raise ConnectionError("forkserver exited")
+        return json.loads(data)
+
+    async def run(self, path: str, cwd: str, input_data: str, timeout: float, max_output: int,
+                  on_event: Optional[Callable[[str, bytes], None]] = None,
+                  limits: Optional[Dict[str, int]] = None, quota: Optional[int] = None
+                  ) -> Tuple[int, bytes, bytes, bool, Dict[str, Any], float]:
+        """Возвращает (код завершения, stdout, stderr, обрезан ли вывод, потребление ресурсов,
+        время порождения процесса). Лимиты limits применяются в дочернем процессе, quota —
+        объём папки cwd во время работы (при превышении — WorkspaceQuotaExceeded)"""
+        limits = limits or {}
+        cgroup = job_cgroups.create(limits.get("processes"))
+        try:
+            return await self._run_job(path, cwd, input_data, timeout, max_output, on_event, limits, cgroup,
+                                       quota)
+        finally:
+            if cgroup is not None:
+                # Потомки программы, вышедшие из её группы процессов
+                cgroup.kill()
+                job_cgroups.release(cgroup)
+
+    async def _run_job(self, path: str, cwd: str, input_data: str, timeout: float, max_output: int,
+                       on_event: Optional[Callable[[str, bytes], None]], limits: Dict[str, int],
+                       cgroup: Optional[JobCgroup], quota: Optional[int]
+                       ) -> Tuple[int, bytes, bytes, bool, Dict[str, Any], float]:
+        self.jobs += 1
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+
+        started = time.perf_counter()
+        try:
+            socket.send_fds(self.sock, [json.dumps({
+                "path": path, "cwd": cwd, "rlimits": rlimits(limits),
+                "cgroup": [procs.decode() for procs in cgroup.procs] if cgroup is not None else [],
+            }).encode()],
+                            [stdin_r, stdout_w, stderr_w])
+            pid = (await self._recv())["pid"]
+        except (OSError, ConnectionError, ValueError, KeyError):
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            self.close()
+            raise PoolUnavailable("forkserver is not responding")
+        except asyncio.CancelledError:
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            self.close()
+            raise
+        finally:
+            for fd in (stdin_r, stdout_w, stderr_w):
+                os.close(fd)
+        spawn_time = time.perf_counter() - started
+
+        truncated = []
+        def on_overflow():
+            truncated.append(True)
+            self._kill(pid)
+
+        watcher = QuotaWatcher(cwd, quota, lambda: self._kill(pid)) if quota is not None else None
+        exited = asyncio.ensure_future(self._recv())
+        io = asyncio.gather(
+            write_pipe(stdin_w, input_data.encode() if input_data else b""),
+            read_pipe(stdout_r, max_output, on_overflow, stream_to(on_event, "stdout")),
+            read_pipe(stderr_r, max_output, on_overflow, stream_to(on_event, "stderr")),
+        )
+
+        async def finish():
+            status = await exited
+            # Программа завершилась: её фоновые потомки не должны держать вывод открытым до таймаута
+            self._kill(pid)
+            if cgroup is not None:
+                cgroup.kill()
+            _, stdout, stderr = await io
+            return stdout, stderr, status
+
+        try:
+            stdout, stderr, status = await asyncio.wait_for(finish(), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._kill(pid)
+            exited.cancel()
+            io.cancel()
+            await asyncio.gather(exited, io, return_exceptions=True)
+            if exited.cancelled():
+                await self._drain()
+            raise
+        except (ConnectionError, ValueError):
+            self._kill(pid)
+            io.cancel()
+            await asyncio.gather(io, return_exceptions=True)
+            self.close()
+            raise RuntimeError("forkserver exited during execution")
+        finally:
+            if watcher is not None:
+                watcher.stop()
+
+        if watcher is not None and watcher.exceeded:
+            raise WorkspaceQuotaExceeded()
+
+        usage = usage_result(status.get("utime", 0.0), status.get("stime", 0.0), status.get("maxrss"))
+        return status["returncode"], stdout, stderr, bool(truncated), usage, spawn_time
+
+    @staticmethod
+    def _kill(pid: int):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    async def _drain(self):
+        # Дожидаемся сообщения о завершении, чтобы не сбить протокол следующей задаче
+        try:
+            await asyncio.wait_for(self._recv(), timeout=1)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            self.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.process is not None and self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+
+
+class WarmPool:
+    """Ограниченный пул прогретых процессов с перезапуском после max_jobs задач"""
+
+    # Команда холодного запуска — база для оценки сэкономленного на старте времени
+    cold_start_cmd: List[str] = []
+
+    def __init__(self, size: int, max_jobs: int, limits: Optional[Dict[str, int]] = None):
+        self.size = size
+        self.max_jobs = max_jobs
+        # Лимиты ресурсов: для fork-сервера — на каждую программу, для node — на процесс задачи
+        self.limits = limits
+        self.slots = asyncio.Semaphore(size)
+        self.idle: list = []
+        # Фоновые запуски замен, ещё не закончившиеся
+        self.starting: set = set()
+        self.cold_start_time: Optional[float] = None
+        self.jobs = 0
+        self.recycled = 0
+        self.startup_avoided = 0.0
+
+    def _create(self):
+        raise NotImplementedError("Subclass must implement _create method")
+
+    async def warm_up(self):
+        while len(self.idle) < self.size:
+            worker = self._create()
+            try:
+                await worker.start()
+            except (OSError, PoolUnavailable):
+                break
+            self.idle.append(worker)
+        self.cold_start_time = await self._measure_cold_start()
+
+    async def _measure_cold_start(self) -> Optional[float]:
+        samples = []
+        for _ in range(3):
+            started = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *self.cold_start_cmd,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                await process.wait()
+            except OSError:
+                return None
+            samples.append(time.perf_counter() - started)
+        return min(samples)
+
+    async def _acquire(self):
+        while True:
+            while self.idle:
+                worker = self.idle.pop()
+                if worker.alive:
+                    return worker
+            if not self.starting:
+                break
+            # Замена уже запускается — ждём её, а не запускаем ещё один процесс параллельно
+            await asyncio.wait(self.starting, return_when=asyncio.FIRST_COMPLETED)
+        worker = self._create()
+        try:
+            await worker.start()
+        except OSError:
+            raise PoolUnavailable("worker could not be started")
+        return worker
+
+    def _release(self, worker):
+        if worker.alive and worker.jobs < self.max_jobs:
+            self.idle.append(worker)
+        else:
+            worker.close()
+            self.recycled += 1
+            # Замена запускается в фоне, чтобы следующая задача не ждала старта
+            task = asyncio.ensure_future(self._replenish())
+            self.starting.add(task)
+            task.add_done_callback(self.starting.discard)
+
+    async def _replenish(self):
+        worker = self._create()
+        try:
+            await worker.start()
+        except (OSError, PoolUnavailable):
+            return
+        if len(self.idle) < self.size:
+            self.idle.append(worker)
+        else:
+            worker.close()
+
+    async def _run(self, *args, **kwargs) -> tuple:
+        """Выполняет задачу на свободном процессе; последний элемент ответа — время старта задачи"""
+        async with self.slots:
+            worker = await self._acquire()
+            try:
+                *result, spawn_time = await worker.run(*args, **kwargs)
+            finally:
+                self._release(worker)
+
+        self.jobs += 1
+        if self.cold_start_time is not None:
+            self.startup_avoided += max(0.0, self.cold_start_time - spawn_time)
+        return tuple(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "idle": len(self.idle),
+            "jobs": self.jobs,
+            "recycled": self.recycled,
+            "cold_start_time": self.cold_start_time,
+            "startup_avoided_seconds": round(self.startup_avoided, 3),
+        }
+
+
+class ForkServerPool(WarmPool):
+    cold_start_cmd = ["python3", "-c", "pass"]
+
+    def _create(self) -> ForkServer:
+        return ForkServer()
+
+    async def run(self, path: str, cwd: str, input_data: str, timeout: float, max_output: int,
+                  on_event: Optional[Callable[[str, bytes], None]] = None, quota: Optional[int] = None
+                  ) -> Tuple[int, bytes, bytes, bool, Dict[str, Any]]:
+        return await self._run(path, cwd, input_data, timeout, max_output, on_event, self.limits, quota)
+
+
+class NodeRunner:
+    """Заранее запущенный процесс node для одной задачи.
+
+    vm-контекст не изолирует программу от процесса, поэтому процесс после задачи
+    не переиспользуется: экономится только старт node, а не граница между пользователями.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.limits = limits
+        self.cgroup = None
+        self.closed = False
+        self.jobs = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None and not self.closed
+
+    async def start(self):
+        # Процесс служит одной задаче, поэтому пик памяти его cgroup — пик этой задачи
+        self.cgroup = job_cgroups.create((self.limits or {}).get("processes"))
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                "node", *NODE_FLAGS, NODE_RUNNER_SCRIPT,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+                limit=NODE_RUNNER_LINE_LIMIT,
+                preexec_fn=limit_resources(self.limits or {}, self.cgroup),
+            )
+        except BaseException:
+            self.close()
+            raise
+        try:
+            message = await asyncio.wait_for(self._recv(), timeout=WORKER_START_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            self.close()
+            raise PoolUnavailable("node runner did not start")
+        if message.get("type") != "ready":
+            self.close()
+            raise PoolUnavailable("node runner did not start")
+
+    async def _recv(self) -> Dict[str, Any]:
+        line = await self.process.stdout.readline()
+        if not line:
+            raise ConnectionError("node runner exited")
+        return json.loads(line)
+
+    async def run(self, code: str, input_lines: List[str], timeout: float, max_output: int,
+                  on_event: Optional[Callable[[str, bytes], None]] = None
+                  ) -> Tuple[int, str, str, bool, Dict[str, Any], float]:
+        """Возвращает (код завершения, stdout, stderr, обрезан ли вывод, потребление ресурсов,
+        время старта задачи)"""
+        self.jobs += 1
+        job = {
+            "id": self.jobs,
+            "code": code,
+            "input": input_lines,
+            # Таймаут vm чуть длиннее нашего: зависший процесс убиваем сами
+            "timeout": int(timeout * 1000) + 1000,
+            "maxOutput": max_output,
+        }
+
+        started = time.perf_counter()
+        try:
+            self.process.stdin.write(json.dumps(job).encode() + b"\n")
+            await self.process.stdin.drain()
+        except (OSError, ConnectionError):
+            self.close()
+            raise PoolUnavailable("node runner is not responding")
+        spawn_time = time.perf_counter() - started
+
+        output = {"stdout": [], "stderr": []}
+
+        async def collect():
+            while True:
+                message = await self._recv()
+                if message.get("id") != job["id"]:
+                    continue
+                if message["type"] == "exit":
+                    return message
+                if on_event is not None:
+                    on_event(message["type"], message["data"].encode())
+                else:
+                    output[message["type"]].append(message["data"])
+
+        try:
+            status = await asyncio.wait_for(collect(), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Зависшую задачу не прервать изнутри — процесс заменяется новым
+            self.close()
+            raise
+        except (ConnectionError, ValueError):
+            self.close()
+            raise RuntimeError("node runner exited during execution")
+
+        memory = self.cgroup.peak() if self.cgroup is not None else None
+        usage = usage_result(status.get("userTime", 0.0), status.get("systemTime", 0.0), memory)
+        return (status["code"], "".join(output["stdout"]), "".join(output["stderr"]),
+                bool(status.get("truncated")), usage, spawn_time)
+
+    def close(self):
+        if self.alive:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+        self.closed = True
+        if self.cgroup is not None:
+            job_cgroups.release(self.cgroup)
+            self.cgroup = None
+
+
+class NodeRunnerPool(WarmPool):
+    cold_start_cmd = ["node", "-e", ""]
+
+    def __init__(self, size: int, limits: Optional[Dict[str, int]] = None):
+        # Одна задача на процесс: замена запускается в фоне сразу после задачи
+        super().__init__(size, 1, limits)
+
+    def _create(self) -> NodeRunner:
+        return NodeRunner(self.limits)
+
+    async def run(self, code: str, input_lines: List[str], timeout: float, max_output: int,
+                  on_event: Optional[Callable[[str, bytes], None]] = None
+                  ) -> Tuple[int, str, str, bool, Dict[str, Any]]:
+        return await self._run(code, input_lines, timeout, max_output, on_event)
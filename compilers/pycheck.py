@@ -0,0 +1,27 @@
+"""Проверка синтаксиса Python для PythonCompiler.check().
+
+Небольшой код проверяется прямо в процессе сервиса (import), большой — отдельным
+процессом: compile() держит GIL и на сотнях килобайт останавливал бы цикл событий.
+
+    python3 pycheck.py < main.py
+    -> [[строка, колонка, "error" | "warning", "сообщение"], ...]
+"""
+import json, sys, warnings
+
+
+def check_source(code: str) -> list:
+    """compile() без выполнения: список (строка, колонка, уровень, сообщение)"""
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        try:
+            compile(code, "main.py", "exec")
+        except SyntaxError as e:
+            return [(e.lineno, e.offset, "error", f"{type(e).__name__}: {e.msg}")]
+        except (ValueError, MemoryError, RecursionError) as e:
+            return [(None, None, "error", f"{type(e).__name__}: {e}")]
+
+    return [(w.lineno, None, "warning", f"{w.category.__name__}: {w.message}") for w in caught]
+
+
+if __name__ == "__main__":
+    json.dump(check_source(sys.stdin.read()), sys.stdout)
@@ -0,0 +1,128 @@
+"""Fork-сервер для PythonCompiler.
+
+Запускается отдельным процессом python3 и получает задачи по unix-сокету
+(SOCK_SEQPACKET, дескриптор передаётся первым аргументом). Вместе с каждой
+задачей приходят три дескриптора: stdin, stdout и stderr будущей программы.
+На каждую задачу делается fork: программа выполняется в собственном процессе,
+поэтому состояние между пользователями не переносится, а интерпретатор и
+стандартные модули уже загружены.
+
+Протокол (JSON-сообщения):
+    -> {"path": ".../main.py", "cwd": "...", "rlimits": [[ресурс, мягкий, жёсткий], ...],
+        "cgroup": [".../cgroup.procs", ...]}
+       + fds [stdin, stdout, stderr]
+    <- {"pid": 123}
+    <- {"pid": 123, "returncode": 0, "utime": 0.01, "stime": 0.0, "maxrss": 10240}
+       (время CPU в секундах, пик памяти в КБ — из wait4)
+"""
+import builtins, io, json, os, resource, socket, sys, traceback
+
+# Модули, которые чаще всего импортируют решения: загружаем их заранее
+PRELOAD_MODULES = [
+    "math", "re", "random", "string", "collections", "itertools", "functools",
+    "heapq", "bisect", "json", "datetime", "decimal", "fractions", "statistics",
+    "typing", "dataclasses", "copy", "operator",
+]
+
+
+def preload():
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+def run_child(job: dict, fds: list) -> int:
+    """Выполняется в дочернем процессе, возвращает код завершения"""
+    # Своя группа процессов: таймаут убивает программу вместе с потомками
+    os.setsid()
+
+    # cgroup запуска ограничивает число процессов программы
+    for procs in job.get("cgroup", []):
+        with open(procs, "w") as f:
+            f.write("0")
+
+    # Лимиты ресурсов программы; счётчик CPU у нового процесса начинается с нуля
+    for resource_id, soft, hard in job.get("rlimits", []):
+        resource.setrlimit(resource_id, (soft, hard))
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False, errors="backslashreplace")
+
+    path = job["path"]
+    os.chdir(job["cwd"])
+    sys.argv = [path]
+    sys.path[0] = os.path.dirname(path)
+
+    try:
+        with io.open_code(path) as f:
+            source = f.read()
+        code = compile(source, path, "exec")
+        exec(code, {
+            "__name__": "__main__",
+            "__file__": path,
+            "__builtins__": builtins,
+            "__doc__": None,
+            "__package__": None,
+            "__spec__": None,
+        })
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Кадр run_child пользователю не нужен — печатаем как обычный python3
+        tb = e.__traceback__.tb_next if e.__traceback__ else None
+        traceback.print_exception(type(e), e, tb)
+        return 1
+    return 0
+
+
+def serve(sock: socket.socket):
+    sock.send(json.dumps({"ready": True}).encode())
+
+    while True:
+        message, fds, _, _ = socket.recv_fds(sock, 65536, 3)
+        if not message:
+            return
+        job = json.loads(message)
+
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            try:
+                returncode = run_child(job, fds)
+            except BaseException:
+                # Не удалось подготовить процесс (cgroup, лимиты) — программа не запускается
+                os._exit(1)
+            # Обычный выход интерпретатора: atexit, потоки, сброс буферов
+            sys.exit(returncode)
+
+        for fd in fds:
+            os.close(fd)
+        sock.send(json.dumps({"pid": pid}).encode())
+
+        _, status, usage = os.wait4(pid, 0)
+        sock.send(json.dumps({
+            "pid": pid,
+            "returncode": os.waitstatus_to_exitcode(status),
+            "utime": usage.ru_utime,
+            "stime": usage.ru_stime,
+            "maxrss": usage.ru_maxrss,
+        }).encode())
+
+
+if __name__ == "__main__":
+    preload()
+    try:
+        serve(socket.socket(fileno=int(sys.argv[1])))
+    except (ConnectionError, OSError):
+        # Родительский процесс закрыл сокет — просто выходим
+        pass
@@ -1,11 +1,67 @@
-import os
-from compilers.base import CompilerBase
+import os, asyncio, json
+from compilers.base import CompilerBase, usage_fields, diagnostic
+from compilers.pool import ForkServerPool, PoolUnavailable
+from compilers.pycheck import check_source
+from compilers.workspace import WorkspaceQuotaExceeded
+from telemetry import span
+
+# Пул прогретых интерпретаторов: каждый форкает свежий процесс на задачу
+FORKSERVER_POOL_SIZE = os.cpu_count() or 2
+FORKSERVER_MAX_JOBS = 200
+
+# Проверка синтаксиса: compile() занимает около 1 мс на КБ и блокирует цикл событий,
+# поэтому код больше порога проверяется отдельным процессом
+PYCHECK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pycheck.py")
+INLINE_CHECK_LIMIT = 16 * 1024
 
 class PythonCompiler(CompilerBase):
     def __init__(self):
         super().__init__("python", timeout=5)
+        self.pool = ForkServerPool(FORKSERVER_POOL_SIZE, FORKSERVER_MAX_JOBS, self.limits)
+    
+    def warm_up(self):
+        """Запуск fork-серверов в фоне при старте сервиса"""
+        asyncio.ensure_future(self.pool.warm_up())
+    
+    async def _run_warm(self, source_file: str, input_data: str, cwd: str, on_event=None):
+        try:
+            with span("run"):
+                returncode, stdout, stderr, truncated, usage = await self.pool.run(
+                    source_file, cwd, input_data, self.timeout, self.max_output_size, on_event,
+                    quota=self.workspaces.quota
+                )
+        except asyncio.TimeoutError:
+            return self._timeout_result()
+        except WorkspaceQuotaExceeded:
+            return self._quota_result()
+        except PoolUnavailable:
+            # Пул недоступен — запускаем интерпретатор как раньше
+            with span("run"):
+                return await self._run_process(["python3", source_file], input_data=input_data, cwd=cwd,
+                                               on_event=on_event)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Execution error: {str(e)}"
+            }
+        result = self._process_result(returncode, stdout, stderr, truncated)
+        result.update(usage)
+        return result
+        
+    async def check(self, code: str):
+        # compile(): только разбор и байткод, код не выполняется
+        if len(code) <= INLINE_CHECK_LIMIT:
+            return [diagnostic(*item) for item in check_source(code)]
         
-    async def _execute(self, code: str, input_data: str, temp_dir: str):
+        result = await self._run_process(["python3", PYCHECK_SCRIPT], input_data=code)
+        if result.get("timedOut"):
+            return [diagnostic(None, None, "error", result["error"])]
+        try:
+            return [diagnostic(*item) for item in json.loads(result.get("output") or "")]
+        except (ValueError, TypeError):
+            return [diagnostic(None, None, "error", result.get("error") or "Syntax check failed")]
+    
+    async def _prepare(self, code: str, temp_dir: str, on_event=None, **options):
         code = self._sanitize_code(code)
         if not code:
             return {
@@ -16,52 +72,45 @@ class PythonCompiler(CompilerBase):
         source_file = os.path.join(temp_dir, "main.py")
         
         # Записываем код
-        with open(source_file, 'w') as f:
-            f.write(code)
-        
-        # Проверка на требования ввода
-        input_check = self._check_input_requirements(code)
-        if input_check["requiresInput"] and not input_data:
-            return {
-                "success": False,
-                "requiresInput": True,
-                "inputDescription": input_check["inputDescription"],
-                "error": "Program requires input"
-            }
+        with span("write"):
+            with open(source_file, 'w') as f:
+                f.write(code)
         
+        return {"success": True, "code": code, "source": source_file, "meta": {}}
+    
+    async def _run_prepared(self, prepared, input_data: str, cwd: str, on_event=None):
         # Запуск Python
-        run_result = await self._run_process(
-            ["python3", source_file],
-            input_data=input_data,
-            cwd=temp_dir
-        )
+        run_result = await self._run_warm(prepared["source"], input_data, cwd, on_event)
         
         # Парсинг ошибок Python
-        if not run_result["success"] and run_result.get("error"):
-            error_lines = run_result["error"].split('\n')
-            for i, line in enumerate(error_lines):
-                if "line" in line:
-                    try:
-                        # Извлечение номера строки
-                        parts = line.split(',')
-                        for part in parts:
-                            if "line" in part:
-                                line_num = int(part.split()[-1])
-                                # Поиск сообщения об ошибке
-                                if i + 1 < len(error_lines):
-                                    for j in range(i, len(error_lines)):
-                                        if "Error:" in error_lines[j]:
-                                            message = error_lines[j].strip()
-                                            return {
-                                                "success": False,
-                                                "error": "Runtime error",
-                                                "details": {
-                                                    "line": line_num,
-                                                    "message": message
+        with span("parse"):
+            if not run_result["success"] and run_result.get("error"):
+                error_lines = run_result["error"].split('\n')
+                for i, line in enumerate(error_lines):
+                    if "line" in line:
+                        try:
+                            # Извлечение номера строки
+                            parts = line.split(',')
+                            for part in parts:
+                                if "line" in part:
+                                    line_num = int(part.split()[-1])
+                                    # Поиск сообщения об ошибке
+                                    if i + 1 < len(error_lines):
+                                        for j in range(i, len(error_lines)):
+                                            if "Error:" in error_lines[j]:
+                                                message = error_lines[j].strip()
+                                                return {
+                                                    "success": False,
+                                                    "error": "Runtime error",
+                                                    "details": {
+                                                        "line": line_num,
+                                                        "message": message
+                                                    },
+                                                    **usage_fields(run_result)
                                                 }
-                                            }
-                                break
-                    except:
-                        pass
+                                    break
+                        except:
+                            pass
+        
         
         return run_result
\ No newline at end of file
@@ -0,0 +1,25 @@
+from typing import Dict
+
+from compilers.base import CompilerBase
+from compilers.cpp import CppCompiler
+from compilers.python import PythonCompiler
+from compilers.javascript import JavaScriptCompiler
+
+
+def create_compilers() -> Dict[str, CompilerBase]:
+    """Реестр компиляторов: общий для процесса API и отдельных исполнителей (worker.py)"""
+    return {
+        "cpp": CppCompiler(),
+        "python": PythonCompiler(),
+        "javascript": JavaScriptCompiler(),
+    }
+
+
+def language_concurrency(pool_size: int) -> Dict[str, int]:
+    # Ограничения параллелизма по языкам: g++ нагружает CPU и память,
+    # а запуски python3/node в основном упираются в старт процесса
+    return {
+        "cpp": max(1, pool_size // 2),
+        "python": pool_size,
+        "javascript": pool_size,
+    }
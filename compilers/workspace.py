@@ -0,0 +1,188 @@
+import asyncio, atexit, os, shutil, tempfile
+
+from typing import Dict, Any, List, Optional, Callable
+
+# Рабочие папки держим в памяти (tmpfs), если /dev/shm есть и разрешает запуск бинарников
+WORKSPACE_ROOTS = ["/dev/shm", tempfile.gettempdir()]
+# Квота на одну рабочую папку: во время запуска её проверяет QuotaWatcher, а превысившая
+# её папка не переиспользуется. Размер отдельного файла ограничивает RLIMIT_FSIZE
+WORKSPACE_QUOTA = 64 * 1024 * 1024
+# Как часто проверяется объём папки во время запуска (секунды)
+WORKSPACE_CHECK_INTERVAL = 0.02
+WORKSPACE_POOL_SIZE = os.cpu_count() or 2
+
+
+def pick_root(candidates: List[str], reserve: int) -> str:
+    """Первый каталог, где можно создавать и запускать файлы и есть место на reserve байт"""
+    for path in candidates:
+        try:
+            stat = os.statvfs(path)
+        except OSError:
+            continue
+        if stat.f_flag & (os.ST_NOEXEC | os.ST_RDONLY):
+            continue
+        if stat.f_bavail * stat.f_frsize < reserve or not os.access(path, os.W_OK | os.X_OK):
+            continue
+        return path
+    return tempfile.gettempdir()
+
+
+def empty_directory(path: str) -> int:
+    """Удаляет содержимое папки (саму папку оставляет), возвращает занятый объём в байтах"""
+    used = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                for root, _, files in os.walk(entry.path):
+                    for name in files:
+                        try:
+                            used += os.lstat(os.path.join(root, name)).st_size
+                        except OSError:
+                            pass
+                shutil.rmtree(entry.path)
+            else:
+                used += entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+    return used
+
+
+class WorkspaceQuotaExceeded(Exception):
+    """Программа записала в рабочую папку больше квоты и была остановлена"""
+
+
+def directory_usage(path: str) -> int:
+    """Занятое место в папке в байтах: по выделенным блокам, разреженные файлы не в счёт"""
+    used = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    used += stat.st_blocks * 512
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError:
+            continue
+    return used
+
+
+class QuotaWatcher:
+    """Следит за объёмом рабочей папки во время запуска и при превышении квоты вызывает
+    on_exceeded (убить программу). Пока квота не проверена, программа успевает записать
+    не больше того, что пишется за WORKSPACE_CHECK_INTERVAL
+    """
+
+    def __init__(self, path: str, quota: int, on_exceeded: Callable[[], None],
+                 interval: float = WORKSPACE_CHECK_INTERVAL):
+        self.path = path
+        self.quota = quota
+        self.on_exceeded = on_exceeded
+        self.interval = interval
+        self.exceeded = False
+        self._task = asyncio.ensure_future(self._watch())
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            # Обход папки с большим числом файлов не должен держать цикл событий
+            used = await loop.run_in_executor(None, directory_usage, self.path)
+            if used > self.quota:
+                self.exceeded = True
+                self.on_exceeded()
+                return
+
+    def stop(self):
+        self._task.cancel()
+
+
+class WorkspacePool:
+    """Пул заранее созданных рабочих папок для запусков.
+
+    acquire() отдаёт чистую папку без обращения к файловой системе (новая создаётся,
+    только если свободных нет), release() возвращает её сразу, а очистка идёт в фоне.
+    Свободных папок хранится не больше size — по числу одновременно выполняемых задач.
+    """
+
+    def __init__(self, size: int = WORKSPACE_POOL_SIZE, quota: int = WORKSPACE_QUOTA,
+                 roots: Optional[List[str]] = None):
+        self.size = size
+        self.quota = quota
+        self.roots = roots or WORKSPACE_ROOTS
+        self.base: Optional[str] = None
+        self.idle: List[str] = []
+        self.cleaning = 0
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.over_quota = 0
+
+    def _ensure_base(self) -> str:
+        if self.base is None:
+            root = pick_root(self.roots, self.size * self.quota)
+            self.base = tempfile.mkdtemp(prefix="compilehub_ws_", dir=root)
+            # tmpfs не очищается при выходе процесса — без close() папки остались бы в памяти
+            atexit.register(self.close)
+        return self.base
+
+    def _create(self) -> str:
+        self.created += 1
+        return tempfile.mkdtemp(prefix="compile_", dir=self._ensure_base())
+
+    def warm_up(self):
+        """Создаёт size свободных папок заранее"""
+        while len(self.idle) < self.size:
+            self.idle.append(self._create())
+
+    def acquire(self) -> str:
+        if self.idle:
+            self.reused += 1
+            return self.idle.pop()
+        return self._create()
+
+    def release(self, path: str):
+        """Возвращает папку; очистка выполняется в фоне, вне пути запроса"""
+        self.cleaning += 1
+        asyncio.ensure_future(self._recycle(path))
+
+    async def _recycle(self, path: str):
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                used = await loop.run_in_executor(None, empty_directory, path)
+            except OSError:
+                # Программа могла оставить то, что не удаляется (например, сняв права), — не рискуем
+                used = None
+
+            if used is not None and used > self.quota:
+                self.over_quota += 1
+            if used is None or used > self.quota or len(self.idle) >= self.size:
+                self.discarded += 1
+                await loop.run_in_executor(None, shutil.rmtree, path, True)
+                return
+            self.idle.append(path)
+        finally:
+            self.cleaning -= 1
+
+    def close(self):
+        if self.base is not None:
+            shutil.rmtree(self.base, ignore_errors=True)
+            self.base = None
+        self.idle.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "root": os.path.dirname(self.base) if self.base else None,
+            "size": self.size,
+            "idle": len(self.idle),
+            "cleaning": self.cleaning,
+            "created": self.created,
+            "reused": self.reused,
+            "discarded": self.discarded,
+            "over_quota": self.over_quota,
+            "quota_bytes": self.quota,
+        }
@@ -1,54 +1,205 @@
-import sqlite3, json
-from typing import Optional, List, Dict, Any
+import sqlite3, json, asyncio, threading, time, hashlib, zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Callable
 from datetime import datetime
 
+from telemetry import LatencyHistogram
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Потоки для запросов к БД: у каждого потока своё соединение
+DB_POOL_SIZE = 4
+# Сколько подготовленных запросов хранит каждое соединение
+DB_STATEMENT_CACHE = 256
+# Сколько ждать блокировку записи, прежде чем вернуть ошибку (мс)
+DB_BUSY_TIMEOUT = 5000
+
+# Код хранится сжатым в code_blobs по sha256 и разделяется между файлами
+CODE_ZLIB_LEVEL = 6
+CODE_ZSTD_LEVEL = 9
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def compress_code(code: str) -> tuple:
+    """Возвращает (кодек, данные): zstd, если установлен, иначе zlib; raw — если сжатие не помогло"""
+    raw = code.encode("utf-8")
+    if zstandard is not None:
+        codec, data = "zstd", zstandard.ZstdCompressor(level=CODE_ZSTD_LEVEL).compress(raw)
+    else:
+        codec, data = "zlib", zlib.compress(raw, CODE_ZLIB_LEVEL)
+    if len(data) >= len(raw):
+        return "raw", raw
+    return codec, data
+
+
+def decompress_code(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("code blob is zstd-compressed, but zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    else:
+        raw = data
+    return raw.decode("utf-8")
+
+
+def put_code_blob(cursor: sqlite3.Cursor, code: str, references: int = 1) -> str:
+    """Добавляет ссылки на блоб с кодом (создаёт его при необходимости), возвращает хеш"""
+    digest = code_hash(code)
+    cursor.execute("UPDATE code_blobs SET refcount = refcount + ? WHERE hash = ?", (references, digest))
+    if cursor.rowcount == 0:
+        # Новый код — сжимаем только его, повторы обходятся одним UPDATE
+        codec, data = compress_code(code)
+        cursor.execute(
+            "INSERT INTO code_blobs (hash, codec, data, length, refcount) VALUES (?, ?, ?, ?, ?)",
+            (digest, codec, data, len(code), references)
+        )
+    return digest
+
+
+def migrate_code_to_blobs(cursor: sqlite3.Cursor):
+    # Переносим код из files.code в code_blobs
+    rows = cursor.execute("SELECT id, code FROM files WHERE code IS NOT NULL AND code != ''").fetchall()
+    for file_id, code in rows:
+        cursor.execute("UPDATE files SET code_hash = ?, code = NULL WHERE id = ?",
+                       (put_code_blob(cursor, code), file_id))
+
+
+# Миграции схемы по порядку: номер последней применённой хранится в PRAGMA user_version
+SCHEMA_MIGRATIONS = [
+    # 1: исходные таблицы
+    [
+        # Таблица пользователей
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            username VARCHAR(20) UNIQUE NOT NULL,
+            password VARCHAR(64) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица файлов и папок
+        '''
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            type VARCHAR(10) NOT NULL,
+            size VARCHAR(20),
+            folder_id INTEGER,
+            code TEXT,
+            code_lang VARCHAR(20),
+            modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (folder_id) REFERENCES files(id) ON DELETE CASCADE
+        )
+        ''',
+        # Таблица лимитов
+        '''
+        CREATE TABLE IF NOT EXISTS limits (
+            user_id INTEGER PRIMARY KEY,
+            count_files INTEGER DEFAULT 0,
+            length_code INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        ''',
+    ],
+    # 2: индексы для списка файлов и вложенности папок.
+    # Индекс списка покрывающий: метаданные читаются без обращения к строкам с кодом
+    [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_files_user_listing
+        ON files (user_id, type DESC, name, id, size, modified, folder_id)
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_files_folder ON files (folder_id)",
+    ],
+    # 3: код — в сжатых блобах по хешу содержимого, одинаковый код хранится один раз
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS code_blobs (
+            hash CHAR(64) PRIMARY KEY,
+            codec VARCHAR(10) NOT NULL,
+            data BLOB NOT NULL,
+            length INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "ALTER TABLE files ADD COLUMN code_hash CHAR(64) REFERENCES code_blobs(hash)",
+        "CREATE INDEX IF NOT EXISTS idx_files_code_hash ON files (code_hash)",
+        migrate_code_to_blobs,
+    ],
+]
+
+# Поддерево файла/папки (включая её саму) — одним рекурсивным запросом.
+# UNION, а не UNION ALL: зацикленные после старых перемещений папки не зациклят запрос
+SUBTREE_CTE = '''
+    WITH RECURSIVE subtree(id) AS (
+        SELECT id FROM files WHERE id = ?
+        UNION
+        SELECT files.id FROM files JOIN subtree ON files.folder_id = subtree.id
+    )
+'''
+
+# Длина кода файла: из блоба, для строк без блоба — из files.code
+CODE_LENGTH_SQL = "COALESCE((SELECT length FROM code_blobs WHERE hash = files.code_hash), LENGTH(files.code))"
+
+# Сколько файлов максимум отдаётся одной страницей
+MAX_FILES_PAGE = 1000
+
 
 class DBase:
     def __init__(self, db_path):
-        """Подключаемся к БД и сохраняем курсор соединения"""
-        self.connection = sqlite3.connect(db_path)
-        self.connection.row_factory = sqlite3.Row
-        self.cursor = self.connection.cursor()
+        """Соединения создаются лениво: по одному на поток"""
+        self.db_path = db_path
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
 
-    def init_db(self):
-        with self.connection:
-            # Таблица пользователей
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    username VARCHAR(20) UNIQUE NOT NULL,
-                    password VARCHAR(64) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, cached_statements=DB_STATEMENT_CACHE,
+                                     check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        # WAL: чтение не блокируется записью, запись — одним fsync на транзакцию
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT}")
+        with self.lock:
+            self.connections.append(connection)
+        return connection
 
-            # Таблица файлов и папок
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS files (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    name VARCHAR(100) NOT NULL,
-                    type VARCHAR(10) NOT NULL,
-                    size VARCHAR(20),
-                    folder_id INTEGER,
-                    code TEXT,
-                    code_lang VARCHAR(20),
-                    modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                    FOREIGN KEY (folder_id) REFERENCES files(id) ON DELETE CASCADE
-                )
-            ''')
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = self._connect()
+            self.local.cursor = connection.cursor()
+        return connection
 
-            # Таблица лимитов
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS limits (
-                    user_id INTEGER PRIMARY KEY,
-                    count_files INTEGER DEFAULT 0,
-                    length_code INTEGER DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                )
-            ''')
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        self.connection  # при первом обращении создаёт соединение и курсор потока
+        return self.local.cursor
+
+    def init_db(self):
+        """Применяет миграции схемы, которых ещё нет в БД (номер хранится в user_version)"""
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+            with self.connection:
+                self.cursor.execute("BEGIN IMMEDIATE")
+                for statement in statements:
+                    if callable(statement):
+                        statement(self.cursor)
+                    else:
+                        self.cursor.execute(statement)
+                self.cursor.execute(f"PRAGMA user_version = {number}")
 
     # Пользователи
     def create_user(self, email: str, username: str, password: str) -> int:
@@ -83,10 +234,12 @@ class DBase:
                     folder_id: Optional[int] = None, code: Optional[str] = None,
                     code_lang: Optional[str] = None) -> int:
         with self.connection:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            stored_hash, stored_code = self._store_code(code)
             self.cursor.execute('''
-                INSERT INTO files (user_id, name, type, size, folder_id, code, code_lang, modified)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, name, file_type, size, folder_id, code, code_lang,
+                INSERT INTO files (user_id, name, type, size, folder_id, code, code_hash, code_lang, modified)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, name, file_type, size, folder_id, stored_code, stored_hash, code_lang,
                   datetime.now().isoformat()))
 
             file_id = self.cursor.lastrowid
@@ -105,6 +258,62 @@ class DBase:
 
             return file_id
 
+    def create_files(self, user_id: int, files: List[Dict[str, Any]]) -> Dict[int, int]:
+        """Массовое создание файлов одной транзакцией.
+        
+        files — словари с полями FileItem; folder ссылается на id папок из того же списка
+        (идентификаторы клиента). Возвращает соответствие id клиента -> id в БД.
+        """
+        with self.connection:
+            # Блокировка записи сразу: выданные ниже id никто не займёт
+            self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute(
+                "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'files'), 0), "
+                "COALESCE((SELECT MAX(id) FROM files), 0))"
+            )
+            next_id = self.cursor.fetchone()[0] + 1
+
+            id_map = {}
+            for offset, file in enumerate(files):
+                id_map[file["id"]] = next_id + offset
+
+            # Одинаковый код внутри пачки — один блоб с нужным числом ссылок
+            references = {}
+            for file in files:
+                if file.get("code"):
+                    references[file["code"]] = references.get(file["code"], 0) + 1
+            hashes = {code: put_code_blob(self.cursor, code, count) for code, count in references.items()}
+
+            modified = datetime.now().isoformat()
+            rows = []
+            count_files = 0
+            length_code = 0
+            for offset, file in enumerate(files):
+                # Папка не из этого списка — файл попадает в корень
+                folder_id = id_map.get(file.get("folder")) if file.get("folder") is not None else None
+                code = file.get("code")
+                rows.append((next_id + offset, user_id, file["name"], file["type"], file.get("size"),
+                             folder_id, None if code else code, hashes.get(code) if code else None,
+                             file.get("code_lang"), modified))
+                if file["type"] == "file":
+                    count_files += 1
+                    length_code += len(code) if code else 0
+
+            self.cursor.executemany('''
+                INSERT INTO files (id, user_id, name, type, size, folder_id, code, code_hash, code_lang, modified)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+            # Лимиты — одним обновлением на всю пачку
+            if count_files:
+                self.cursor.execute(
+                    "UPDATE limits SET count_files = count_files + ?, length_code = length_code + ? "
+                    "WHERE user_id = ?",
+                    (count_files, length_code, user_id)
+                )
+
+            return id_map
+
     def get_user_files(self, user_id: int) -> List[Dict[str, Any]]:
         with self.connection:
             self.cursor.execute(
@@ -112,49 +321,140 @@ class DBase:
                 (user_id,)
             )
             rows = self.cursor.fetchall()
-            return [dict(row) for row in rows]
+            return [self._with_code(row) for row in rows]
+
+    def list_user_files(self, user_id: int, limit: Optional[int] = None,
+                        after: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        """Метаданные файлов пользователя без кода, в порядке (type DESC, name, id).
+        
+        after — ключ (type, name, id) последней строки предыдущей страницы.
+        """
+        query = "SELECT id, name, type, size, modified, folder_id FROM files WHERE user_id = ?"
+        params: list = [user_id]
+        if after is not None:
+            after_type, after_name, after_id = after
+            # Лишнее на вид type <= ? даёт SQLite границу для поиска по индексу
+            query += " AND type <= ? AND (type < ? OR (type = ? AND (name, id) > (?, ?)))"
+            params += [after_type, after_type, after_type, after_name, after_id]
+        query += " ORDER BY type DESC, name, id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self.connection:
+            self.cursor.execute(query, params)
+            return [dict(row) for row in self.cursor.fetchall()]
 
     def get_file_by_id(self, file_id: int) -> Optional[Dict[str, Any]]:
         with self.connection:
             self.cursor.execute("SELECT * FROM files WHERE id = ?", (file_id,))
             row = self.cursor.fetchone()
-            return dict(row) if row else None
+            return self._with_code(row) if row else None
+
+    def get_file_code(self, file_id: int, known_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Код файла и его хеш (для ETag); если хеш совпал с known_hash, код не читается и не распаковывается"""
+        with self.connection:
+            self.cursor.execute("SELECT code, code_hash FROM files WHERE id = ?", (file_id,))
+            row = self.cursor.fetchone()
+            if not row:
+                return None
+            if row["code_hash"] is None:
+                code = row["code"] or ""
+                return {"hash": code_hash(code), "code": code}
+            if row["code_hash"] == known_hash:
+                return {"hash": known_hash, "code": None}
+            return {"hash": row["code_hash"], "code": self._load_code(row["code_hash"])}
+
+    def _store_code(self, code: Optional[str]) -> tuple:
+        # (code_hash, code) для строки files: непустой код уходит в блоб
+        if not code:
+            return None, code
+        return put_code_blob(self.cursor, code), None
+
+    def _load_code(self, digest: str) -> Optional[str]:
+        row = self.connection.execute("SELECT codec, data FROM code_blobs WHERE hash = ?", (digest,)).fetchone()
+        return decompress_code(row["codec"], row["data"]) if row else None
+
+    def _with_code(self, row: sqlite3.Row) -> Dict[str, Any]:
+        file = dict(row)
+        digest = file.pop("code_hash", None)
+        if digest is not None:
+            file["code"] = self._load_code(digest)
+        return file
 
     def update_file_folder(self, file_id: int, folder_id: Optional[int]):
+        """Перемещает файл или папку целиком (вложенное едет вместе с ней)"""
         with self.connection:
+            if folder_id is not None:
+                # Папку нельзя положить в саму себя или в свою подпапку
+                self.cursor.execute(
+                    SUBTREE_CTE + "SELECT 1 FROM subtree WHERE id = ?",
+                    (file_id, folder_id)
+                )
+                if self.cursor.fetchone():
+                    raise ValueError("Cannot move a folder into itself")
+
             self.cursor.execute(
                 "UPDATE files SET folder_id = ?, modified = ? WHERE id = ?",
                 (folder_id, datetime.now().isoformat(), file_id)
             )
 
     def delete_file(self, file_id: int):
+        """Удаляет файл или папку со всем содержимым, лимиты уменьшаются в той же транзакции"""
         with self.connection:
-            # Получаем информацию о файле
-            self.cursor.execute("SELECT * FROM files WHERE id = ?", (file_id,))
-            file = self.cursor.fetchone()
+            self.cursor.execute("BEGIN IMMEDIATE")
 
-            if file:
-                file_dict = dict(file)
-                user_id = file_dict["user_id"]
+            # Вычитаем из лимитов все файлы поддерева
+            self.cursor.execute(SUBTREE_CTE + f'''
+                , removed AS (
+                    SELECT COUNT(*) AS files, COALESCE(SUM({CODE_LENGTH_SQL}), 0) AS code_length
+                    FROM files WHERE id IN subtree AND type = 'file'
+                )
+                UPDATE limits SET
+                    count_files = count_files - (SELECT files FROM removed),
+                    length_code = length_code - (SELECT code_length FROM removed)
+                WHERE user_id = (SELECT user_id FROM files WHERE id = ?)
+            ''', (file_id, file_id))
 
-                # Если это файл, обновляем лимиты
-                if file_dict["type"] == "file":
-                    self.cursor.execute(
-                        "UPDATE limits SET count_files = count_files - 1 WHERE user_id = ?",
-                        (user_id,)
-                    )
-                    if file_dict["code"]:
-                        self.cursor.execute(
-                            "UPDATE limits SET length_code = length_code - ? WHERE user_id = ?",
-                            (len(file_dict["code"]), user_id)
-                        )
+            # Снимаем ссылки на блобы кода; блобы без ссылок удаляются
+            self.cursor.execute(SUBTREE_CTE + '''
+                , released AS (
+                    SELECT code_hash, COUNT(*) AS refs FROM files
+                    WHERE id IN subtree AND code_hash IS NOT NULL GROUP BY code_hash
+                )
+                UPDATE code_blobs SET refcount = refcount - released.refs
+                FROM released WHERE code_blobs.hash = released.code_hash
+            ''', (file_id,))
+            self.cursor.execute(SUBTREE_CTE + '''
+                DELETE FROM code_blobs WHERE refcount <= 0 AND hash IN (
+                    SELECT code_hash FROM files WHERE id IN subtree
+                )
+            ''', (file_id,))
 
-                # Удаляем файл
-                self.cursor.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            self.cursor.execute(SUBTREE_CTE + "DELETE FROM files WHERE id IN subtree", (file_id,))
 
-                # Если это папка, удаляем все файлы в ней
-                if file_dict["type"] == "folder":
-                    self.cursor.execute("DELETE FROM files WHERE folder_id = ?", (file_id,))
+    def recompute_limits(self) -> int:
+        """Пересчёт лимитов всех пользователей одним проходом по таблице files.
+        
+        Обслуживающая операция: python database.py recompute-limits [путь к БД]
+        """
+        with self.connection:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute('''
+                INSERT INTO limits (user_id, count_files, length_code)
+                SELECT users.id, COALESCE(totals.files, 0), COALESCE(totals.code_length, 0)
+                FROM users LEFT JOIN (
+                    SELECT files.user_id, COUNT(*) AS files,
+                           COALESCE(SUM(COALESCE(code_blobs.length, LENGTH(files.code))), 0) AS code_length
+                    FROM files LEFT JOIN code_blobs ON code_blobs.hash = files.code_hash
+                    WHERE files.type = 'file' GROUP BY files.user_id
+                ) AS totals ON totals.user_id = users.id
+                WHERE true
+                ON CONFLICT (user_id) DO UPDATE SET
+                    count_files = excluded.count_files,
+                    length_code = excluded.length_code
+            ''')
+            return self.cursor.rowcount
 
     def get_user_limits(self, user_id: int) -> Dict[str, int]:
         with self.connection:
@@ -164,5 +464,105 @@ class DBase:
 
     # ЗАКРЫТИЕ ВЫЗОВА
     def close(self):
-        """Закрываем соединение с БД"""
-        self.connection.close()
\ No newline at end of file
+        """Закрываем соединения всех потоков"""
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections.clear()
+        self.local = threading.local()
+
+
+class AsyncDBase:
+    """Асинхронная обёртка над DBase: запросы выполняются в пуле потоков, не блокируя event loop.
+    
+    Методы повторяют DBase, но вызываются через await.
+    """
+
+    def __init__(self, db_path, pool_size: int = DB_POOL_SIZE):
+        self.db = DBase(db_path)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db")
+        self.latency: Dict[str, LatencyHistogram] = {}
+
+    async def _run(self, method: Callable, *args, **kwargs):
+        def timed():
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed.append(time.perf_counter() - start)
+
+        elapsed = []
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            if elapsed:
+                histogram = self.latency.get(method.__name__)
+                if histogram is None:
+                    histogram = self.latency[method.__name__] = LatencyHistogram()
+                histogram.observe(elapsed[0])
+
+    async def init_db(self):
+        return await self._run(self.db.init_db)
+
+    async def create_user(self, email: str, username: str, password: str) -> int:
+        return await self._run(self.db.create_user, email, username, password)
+
+    async def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.get_user_by_username, username)
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.get_user_by_email, email)
+
+    async def create_file(self, user_id: int, name: str, file_type: str, size: str,
+                          folder_id: Optional[int] = None, code: Optional[str] = None,
+                          code_lang: Optional[str] = None) -> int:
+        return await self._run(self.db.create_file, user_id, name, file_type, size,
+                               folder_id, code, code_lang)
+
+    async def create_files(self, user_id: int, files: List[Dict[str, Any]]) -> Dict[int, int]:
+        return await self._run(self.db.create_files, user_id, files)
+
+    async def get_user_files(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self._run(self.db.get_user_files, user_id)
+
+    async def list_user_files(self, user_id: int, limit: Optional[int] = None,
+                              after: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        return await self._run(self.db.list_user_files, user_id, limit, after)
+
+    async def get_file_by_id(self, file_id: int) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.get_file_by_id, file_id)
+
+    async def update_file_folder(self, file_id: int, folder_id: Optional[int]):
+        return await self._run(self.db.update_file_folder, file_id, folder_id)
+
+    async def delete_file(self, file_id: int):
+        return await self._run(self.db.delete_file, file_id)
+
+    async def get_file_code(self, file_id: int, known_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.get_file_code, file_id, known_hash)
+
+    async def get_user_limits(self, user_id: int) -> Dict[str, int]:
+        return await self._run(self.db.get_user_limits, user_id)
+
+    def latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: histogram.snapshot() for name, histogram in sorted(self.latency.items())}
+
+    async def close(self):
+        # Дожидаемся текущих запросов, затем закрываем соединения
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.db.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "recompute-limits":
+        print("usage: python database.py recompute-limits [db_path]")
+        sys.exit(2)
+
+    db = DBase(sys.argv[2] if len(sys.argv) > 2 else "compilehub.db")
+    db.init_db()
+    start = time.perf_counter()
+    updated = db.recompute_limits()
+    print(f"limits recomputed for {updated} users in {time.perf_counter() - start:.3f}s")
+    db.close()
@@ -0,0 +1,511 @@
+"""Выполнение задач вне процесса API.
+
+Исполнитель (worker.py) держит реестр компиляторов и принимает задачи по соединению,
+API отправляет их через Dispatcher. Транспорт подключаемый:
+    unix:/run/compilehub-1.sock — Unix-сокет на той же машине
+    tcp:10.0.0.5:7001           — TCP, исполнители на других машинах
+    memory:name                 — в памяти процесса (вместо брокера — для тестов)
+
+Протокол — JSON-сообщения (в сокетах — с 4-байтовой длиной впереди):
+    -> {"type": "run", "id": 1, "language": "cpp", "code": "...", "input": "...",
+        "options": {...}, "cases": [...] | null, "stream": false}
+    <- {"type": "event", "id": 1, "event": "stdout", "data": "<base64>"}   (только при stream)
+    <- {"type": "result", "id": 1, "result": {...}}
+    -> {"type": "cancel", "id": 1}
+    -> {"type": "ping", "id": 2}
+    <- {"type": "pong", "id": 2, "load": {...}, "stats": {...}}
+"""
+import asyncio, base64, itertools, json, os, struct, time
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+# Как часто диспетчер проверяет исполнителей и сколько ждёт ответа (секунды)
+HEALTH_CHECK_INTERVAL = 2.0
+HEALTH_CHECK_TIMEOUT = 5.0
+# Сколько раз задача перезапускается на другом исполнителе, если её исполнитель умер
+DISPATCH_RETRIES = 2
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+
+class WorkerUnavailable(Exception):
+    """Исполнитель недоступен или соединение с ним оборвалось"""
+
+
+class Connection:
+    """Двусторонний канал сообщений-словарей"""
+
+    async def send(self, message: Dict[str, Any]):
+        """Отправляет сообщение; ждёт, пока медленный получатель разберёт уже отправленное"""
+        raise NotImplementedError("Subclass must implement send method")
+
+    async def recv(self) -> Dict[str, Any]:
+        """Следующее сообщение; ConnectionError, если канал закрыт"""
+        raise NotImplementedError("Subclass must implement recv method")
+
+    def close(self):
+        raise NotImplementedError("Subclass must implement close method")
+
+
+class StreamConnection(Connection):
+    """Сообщения поверх потока (Unix-сокет или TCP): длина + JSON"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        # drain() из нескольких задач сразу в Python 3.9 не поддерживается
+        self.drain_lock = asyncio.Lock()
+
+    async def send(self, message: Dict[str, Any]):
+        if self.writer.is_closing():
+            raise ConnectionError("connection closed")
+        data = json.dumps(message).encode()
+        # Запись — сразу, чтобы кадры не перемешались; ожидание — пока буфер не опустеет
+        self.writer.write(FRAME_HEADER.pack(len(data)) + data)
+        async with self.drain_lock:
+            await self.writer.drain()
+
+    async def recv(self) -> Dict[str, Any]:
+        try:
+            header = await self.reader.readexactly(FRAME_HEADER.size)
+            (size,) = FRAME_HEADER.unpack(header)
+            if size > MAX_FRAME_SIZE:
+                raise ConnectionError(f"frame too large ({size} bytes)")
+            return json.loads(await self.reader.readexactly(size))
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("connection closed")
+
+    def close(self):
+        self.writer.close()
+
+
+class QueueConnection(Connection):
+    """Один конец канала в памяти: сообщения передаются без сериализации"""
+
+    def __init__(self, incoming: asyncio.Queue, outgoing: asyncio.Queue):
+        self.incoming = incoming
+        self.outgoing = outgoing
+        self.closed = False
+
+    async def send(self, message: Dict[str, Any]):
+        if self.closed:
+            raise ConnectionError("connection closed")
+        self.outgoing.put_nowait(message)
+
+    async def recv(self) -> Dict[str, Any]:
+        message = await self.incoming.get()
+        if message is None:
+            self.closed = True
+            raise ConnectionError("connection closed")
+        return message
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            # Обе стороны получают признак конца
+            self.outgoing.put_nowait(None)
+            self.incoming.put_nowait(None)
+
+
+Handler = Callable[[Connection], Awaitable[None]]
+
+
+class UnixTransport:
+    def __init__(self, path: str):
+        self.path = path
+
+    async def connect(self) -> Connection:
+        return StreamConnection(*await asyncio.open_unix_connection(self.path))
+
+    async def serve(self, handler: Handler) -> asyncio.AbstractServer:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return await asyncio.start_unix_server(
+            lambda reader, writer: handler(StreamConnection(reader, writer)), path=self.path
+        )
+
+    def __str__(self) -> str:
+        return f"unix:{self.path}"
+
+
+class TcpTransport:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+
+    async def connect(self) -> Connection:
+        return StreamConnection(*await asyncio.open_connection(self.host, self.port))
+
+    async def serve(self, handler: Handler) -> asyncio.AbstractServer:
+        return await asyncio.start_server(
+            lambda reader, writer: handler(StreamConnection(reader, writer)), self.host, self.port
+        )
+
+    def __str__(self) -> str:
+        return f"tcp:{self.host}:{self.port}"
+
+
+# Исполнители, запущенные в этом процессе через memory:<name>
+memory_servers: Dict[str, Handler] = {}
+
+
+class MemoryTransport:
+    """Транспорт внутри одного процесса: serve() регистрирует исполнителя под именем,
+    connect() создаёт пару очередей и запускает обработчик на серверном конце"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def connect(self) -> Connection:
+        handler = memory_servers.get(self.name)
+        if handler is None:
+            raise ConnectionError(f"no memory worker named {self.name!r}")
+        to_server, to_client = asyncio.Queue(), asyncio.Queue()
+        asyncio.ensure_future(handler(QueueConnection(to_server, to_client)))
+        return QueueConnection(to_client, to_server)
+
+    async def serve(self, handler: Handler):
+        memory_servers[self.name] = handler
+
+    def stop(self):
+        memory_servers.pop(self.name, None)
+
+    def __str__(self) -> str:
+        return f"memory:{self.name}"
+
+
+def parse_transport(spec: str):
+    """unix:/path, tcp:host:port или memory:name"""
+    kind, _, address = spec.strip().partition(":")
+    if kind == "unix" and address:
+        return UnixTransport(address)
+    if kind == "tcp":
+        host, _, port = address.rpartition(":")
+        if host and port.isdigit():
+            return TcpTransport(host, int(port))
+    if kind == "memory" and address:
+        return MemoryTransport(address)
+    raise ValueError(f"Invalid worker address: {spec!r}")
+
+
+class WorkerServer:
+    """Сторона исполнителя: выполняет задачи на своих компиляторах с лимитами по языкам"""
+
+    def __init__(self, compilers: Dict[str, Any], concurrency: Dict[str, int]):
+        self.compilers = compilers
+        self.concurrency = dict(concurrency)
+        self.semaphores = {language: asyncio.Semaphore(limit) for language, limit in concurrency.items()}
+        self.running = {language: 0 for language in concurrency}
+        self.waiting = {language: 0 for language in concurrency}
+        self.completed = 0
+        self.started_at = time.time()
+
+    async def handle(self, connection: Connection):
+        """Обслуживает одно соединение с диспетчером до его закрытия"""
+        tasks: Dict[int, asyncio.Task] = {}
+        try:
+            while True:
+                message = await connection.recv()
+                kind = message.get("type")
+                if kind == "run":
+                    task = asyncio.ensure_future(self._run(connection, message))
+                    tasks[message["id"]] = task
+                    task.add_done_callback(lambda _, job_id=message["id"]: tasks.pop(job_id, None))
+                elif kind == "cancel":
+                    task = tasks.get(message["id"])
+                    if task is not None:
+                        task.cancel()
+                elif kind == "ping":
+                    await connection.send({"type": "pong", "id": message["id"],
+                                           "load": self.load(), "stats": self.stats()})
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            # Диспетчер отключился — результаты никто не получит
+            for task in list(tasks.values()):
+                task.cancel()
+            connection.close()
+
+    async def _run(self, connection: Connection, message: Dict[str, Any]):
+        language = message["language"]
+        if language not in self.compilers:
+            language = "cpp"
+        compiler = self.compilers[language]
+        options = dict(message.get("options") or {})
+        forwarder = None
+        if message.get("stream"):
+            # on_event вызывается синхронно: события уходят по порядку из отдельной задачи,
+            # которая ждёт медленного получателя; их объём ограничен лимитом вывода
+            events: asyncio.Queue = asyncio.Queue()
+
+            async def forward():
+                try:
+                    while True:
+                        event = await events.get()
+                        if event is None:
+                            return
+                        await connection.send(event)
+                except (ConnectionError, OSError):
+                    pass
+
+            def on_event(event: str, data: bytes):
+                events.put_nowait({"type": "event", "id": message["id"], "event": event,
+                                   "data": base64.b64encode(data).decode()})
+            options["on_event"] = on_event
+            forwarder = asyncio.ensure_future(forward())
+
+        try:
+            semaphore = self.semaphores[language]
+            self.waiting[language] += 1
+            try:
+                await semaphore.acquire()
+            finally:
+                self.waiting[language] -= 1
+            self.running[language] += 1
+            try:
+                if message.get("cases") is not None:
+                    result = await compiler.compile_and_run_batch(message["code"], message["cases"], **options)
+                else:
+                    result = await compiler.compile_and_run(message["code"], message.get("input") or "",
+                                                            **options)
+            finally:
+                self.running[language] -= 1
+                semaphore.release()
+            self.completed += 1
+            try:
+                if forwarder is not None:
+                    # Результат — после всех событий задачи
+                    events.put_nowait(None)
+                    await forwarder
+                await connection.send({"type": "result", "id": message["id"], "result": result})
+            except (ConnectionError, OSError):
+                pass
+        finally:
+            if forwarder is not None:
+                forwarder.cancel()
+
+    def load(self) -> Dict[str, Any]:
+        return {
+            "capacity": dict(self.concurrency),
+            "running": dict(self.running),
+            "waiting": dict(self.waiting),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1),
+            "completed": self.completed,
+            "binary_cache": self.compilers["cpp"].binary_cache.stats(),
+            "python_pool": self.compilers["python"].pool.stats(),
+            "javascript_pool": self.compilers["javascript"].pool.stats(),
+            "workspaces": self.compilers["cpp"].workspaces.stats(),
+        }
+
+
+class RemoteWorker:
+    """Сторона диспетчера: соединение с одним исполнителем и задачи, отправленные ему"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.connection: Optional[Connection] = None
+        self.reader_task: Optional[asyncio.Task] = None
+        self.ids = itertools.count(1)
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.events: Dict[int, Callable[[str, bytes], None]] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.load: Dict[str, Any] = {}
+        self.stats: Dict[str, Any] = {}
+        self.healthy = False
+        self.last_seen: Optional[float] = None
+        self.jobs = 0
+        self.failures = 0
+
+    async def connect(self):
+        self.connection = await self.transport.connect()
+        self.reader_task = asyncio.ensure_future(self._read(self.connection))
+
+    async def _read(self, connection: Connection):
+        try:
+            while True:
+                message = await connection.recv()
+                kind = message.get("type")
+                if kind == "event":
+                    on_event = self.events.get(message["id"])
+                    if on_event is not None:
+                        on_event(message["event"], base64.b64decode(message["data"]))
+                    continue
+                future = self.pending.get(message.get("id"))
+                if future is None or future.done():
+                    continue
+                if kind == "result":
+                    future.set_result(message["result"])
+                elif kind == "pong":
+                    future.set_result(message)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            self._lost(connection)
+
+    def _lost(self, connection: Connection):
+        # Все задачи этого соединения уходят на повтор к другим исполнителям
+        if connection is not self.connection:
+            return
+        self.connection = None
+        self.healthy = False
+        self.failures += 1
+        connection.close()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(WorkerUnavailable(str(self.transport)))
+
+    def disconnect(self):
+        if self.connection is not None:
+            self._lost(self.connection)
+
+    async def _request(self, message: Dict[str, Any],
+                       on_event: Optional[Callable[[str, bytes], None]] = None) -> Dict[str, Any]:
+        if self.connection is None:
+            raise WorkerUnavailable(str(self.transport))
+        message["id"] = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message["id"]] = future
+        if on_event is not None:
+            self.events[message["id"]] = on_event
+        try:
+            await self.connection.send(message)
+            return await future
+        except ConnectionError:
+            raise WorkerUnavailable(str(self.transport))
+        except asyncio.CancelledError:
+            # Задачу отменили на стороне API — исполнитель прерывает выполнение
+            if self.connection is not None and message["type"] == "run":
+                try:
+                    await self.connection.send({"type": "cancel", "id": message["id"]})
+                except (ConnectionError, OSError):
+                    pass
+            raise
+        finally:
+            self.pending.pop(message["id"], None)
+            self.events.pop(message["id"], None)
+
+    async def check(self, timeout: float = HEALTH_CHECK_TIMEOUT):
+        """Проверка здоровья: переподключение при необходимости и ping с обновлением нагрузки"""
+        try:
+            if self.connection is None:
+                await asyncio.wait_for(self.connect(), timeout=timeout)
+            pong = await asyncio.wait_for(self._request({"type": "ping"}), timeout=timeout)
+        except (asyncio.TimeoutError, WorkerUnavailable, ConnectionError, OSError):
+            # Не ответил — считаем умершим: его задачи повторятся на других исполнителях
+            self.disconnect()
+            return
+        self.load = pong.get("load") or {}
+        self.stats = pong.get("stats") or {}
+        self.last_seen = time.time()
+        self.healthy = True
+
+    def score(self, language: str) -> float:
+        """Загрузка по языку: доля занятых слотов (с учётом задач других диспетчеров)"""
+        capacity = (self.load.get("capacity") or {}).get(language) or 1
+        remote = (self.load.get("running") or {}).get(language, 0) + (self.load.get("waiting") or {}).get(language, 0)
+        return max(self.in_flight.get(language, 0), remote) / capacity
+
+    async def run(self, job: Dict[str, Any],
+                  on_event: Optional[Callable[[str, bytes], None]] = None) -> Dict[str, Any]:
+        language = job["language"]
+        self.in_flight[language] = self.in_flight.get(language, 0) + 1
+        self.jobs += 1
+        try:
+            return await self._request(dict(job, type="run", stream=on_event is not None), on_event)
+        finally:
+            self.in_flight[language] -= 1
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "address": str(self.transport),
+            "healthy": self.healthy,
+            "last_seen": self.last_seen,
+            "jobs": self.jobs,
+            "failures": self.failures,
+            "in_flight": dict(self.in_flight),
+            "load": self.load,
+            "stats": self.stats,
+        }
+
+
+class Dispatcher:
+    """Отправка задач пулу исполнителей: самому свободному по языку, с повтором при его смерти"""
+
+    def __init__(self, transports: List[Any], retries: int = DISPATCH_RETRIES,
+                 health_interval: float = HEALTH_CHECK_INTERVAL):
+        self.workers = [RemoteWorker(transport) for transport in transports]
+        self.retries = retries
+        self.health_interval = health_interval
+        self.health_task: Optional[asyncio.Task] = None
+        self.retried = 0
+        self.unavailable = 0
+
+    async def start(self):
+        await self.check()
+        self.health_task = asyncio.ensure_future(self._health_loop())
+
+    async def check(self):
+        await asyncio.gather(*(worker.check() for worker in self.workers))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check()
+
+    def pick(self, language: str, exclude: List[RemoteWorker]) -> Optional[RemoteWorker]:
+        candidates = [worker for worker in self.workers
+                      if worker.healthy and worker.connection is not None and worker not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda worker: worker.score(language))
+
+    async def run(self, language: str, code: str, input_data: str, options: Dict[str, Any],
+                  cases: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        options = dict(options)
+        on_event = options.pop("on_event", None)
+        job = {"language": language, "code": code, "input": input_data, "options": options, "cases": cases}
+
+        streamed = []
+        def forward(event: str, data: bytes):
+            streamed.append(True)
+            on_event(event, data)
+
+        tried: List[RemoteWorker] = []
+        for attempt in range(self.retries + 1):
+            worker = self.pick(language, tried)
+            if worker is None:
+                break
+            try:
+                return await worker.run(job, forward if on_event is not None else None)
+            except WorkerUnavailable:
+                tried.append(worker)
+                # Часть вывода уже ушла клиенту — повтор продублировал бы её
+                if streamed:
+                    break
+                self.retried += 1
+
+        self.unavailable += 1
+        return {
+            "success": False,
+            "error": "No execution workers available"
+        }
+
+    async def close(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+        for worker in self.workers:
+            worker.disconnect()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": [worker.describe() for worker in self.workers],
+            "healthy": sum(1 for worker in self.workers if worker.healthy),
+            "retried": self.retried,
+            "unavailable": self.unavailable,
+        }
@@ -0,0 +1,114 @@
+import asyncio, time, uuid
+
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Сколько хранится результат завершённой задачи (секунды) и сколько задач всего
+JOB_RESULT_TTL = 600
+MAX_JOBS = 1000
+
+
+class JobStoreFull(Exception):
+    """Все места заняты незавершёнными задачами"""
+
+
+class JobStore:
+    """Задачи, поставленные через /api/jobs: ограниченное хранилище с TTL для результатов.
+
+    Хранится сама задача очереди: статус выводится из её future и времени старта,
+    так что воркеру ничего не нужно сообщать хранилищу.
+    """
+
+    def __init__(self, max_jobs: int = MAX_JOBS, ttl: float = JOB_RESULT_TTL):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    def add(self, task: Dict[str, Any]) -> str:
+        self._purge()
+        if len(self.jobs) >= self.max_jobs and not self._evict_finished():
+            raise JobStoreFull
+
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = {"id": job_id, "task": task, "created_at": time.time(), "finished_at": None}
+        task["future"].add_done_callback(lambda _: self._finished(job_id))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        self._purge()
+        return self.jobs.get(job_id)
+
+    def remove(self, job_id: str):
+        self.jobs.pop(job_id, None)
+
+    def _finished(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job["finished_at"] = time.time()
+
+    def _purge(self):
+        # Записей не больше max_jobs — полный проход дешёвый
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job["finished_at"] is not None and job["finished_at"] + self.ttl <= now]:
+            del self.jobs[job_id]
+            self.expired += 1
+
+    def _evict_finished(self) -> bool:
+        # Освобождаем место за счёт самой старой завершённой задачи
+        for job_id, job in self.jobs.items():
+            if job["finished_at"] is not None:
+                del self.jobs[job_id]
+                self.evicted += 1
+                return True
+        return False
+
+    @staticmethod
+    def status(job: Dict[str, Any]) -> str:
+        task = job["task"]
+        future = task["future"]
+        if future.cancelled():
+            return "cancelled"
+        if future.done():
+            return "done"
+        if task.get("started_at") is not None:
+            return "running"
+        return "queued"
+
+    async def wait(self, job: Dict[str, Any], timeout: float):
+        """Long-poll: ждём завершения не дольше timeout, саму задачу не трогаем"""
+        future = job["task"]["future"]
+        if future.done() or timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Отменили саму задачу (DELETE) — для ожидающего это не ошибка
+            if not future.cancelled():
+                raise
+
+    def describe(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        task = job["task"]
+        status = self.status(job)
+        response = {
+            "id": job["id"],
+            "status": status,
+            "language": task["language"],
+            "createdAt": job["created_at"],
+            "startedAt": task.get("started_at"),
+            "finishedAt": job["finished_at"],
+        }
+        if status == "done":
+            response["result"] = task["future"].result()
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {"queued": 0, "running": 0, "done": 0, "cancelled": 0}
+        for job in self.jobs.values():
+            counts[self.status(job)] += 1
+        return dict(counts, stored=len(self.jobs), max_jobs=self.max_jobs,
+                    expired=self.expired, evicted=self.evicted)
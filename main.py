@@ -1,18 +1,25 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 
 from pydantic import BaseModel
 from typing import Optional, List
 from collections import defaultdict, deque
-import asyncio, time, hashlib
+import asyncio, time, hashlib, os, json, codecs, base64
 
-from database import DBase
-from compilers.cpp import CppCompiler
-from compilers.python import PythonCompiler
-from compilers.javascript import JavaScriptCompiler
+from database import AsyncDBase, MAX_FILES_PAGE
+from compilers.cpp import PROFILES
+from compilers.registry import create_compilers, language_concurrency
+from compilers.cache import ResultCache, content_key
+from compilers.workspace import WorkspacePool
+from compilers.cgroups import job_cgroups
+from scheduler import FairScheduler, PRIORITY_WEIGHTS
+from jobs import JobStore, JobStoreFull
+from executor import Dispatcher, parse_transport
+from telemetry import LatencyHistogram, MEMORY_BUCKETS, server_timing, prometheus_histogram
 
 app = FastAPI()
-db = DBase("compilehub.db")
+db = AsyncDBase("compilehub.db")
 
 # CORS
 app.add_middleware(
@@ -21,22 +28,85 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
 # Компиляторы
-compilers = {
-    "cpp": CppCompiler(),
-    "python": PythonCompiler(),
-    "javascript": JavaScriptCompiler(),
+compilers = create_compilers()
+
+# Внешние исполнители (worker.py): "unix:/run/compilehub-1.sock,tcp:10.0.0.5:7001".
+# Если не заданы, задачи выполняются в процессе API
+EXECUTOR_WORKERS = [address for address in os.environ.get("COMPILEHUB_WORKERS", "").split(",") if address.strip()]
+dispatcher = Dispatcher([parse_transport(address) for address in EXECUTOR_WORKERS]) if EXECUTOR_WORKERS else None
+
+# Веса пользователей в очереди (IP -> вес, по умолчанию 1)
+USER_WEIGHTS = {}
+
+# Сколько обработчик ждёт результат задачи (секунды)
+COMPILATION_WAIT_TIMEOUT = 10
+
+# Сколько задач каждого языка может ждать в очереди; сверх лимита — сразу 503
+LANGUAGE_QUEUE_LIMITS = {
+    "cpp": 50,
+    "python": 100,
+    "javascript": 100,
 }
+# Верхняя граница подсказки Retry-After (секунды)
+MAX_RETRY_AFTER = 60
+
+# Задачи через /api/jobs: выполняются независимо от HTTP-запроса
+JOB_TIMEOUT = 300
+MAX_JOB_WAIT = 30
+job_store = JobStore()
+
+# Пакетный запуск тестов: код компилируется один раз, тесты идут параллельно
+MAX_BATCH_CASES = 100
+BATCH_CONCURRENCY = os.cpu_count() or 2
+BATCH_WAIT_TIMEOUT = 60
+
+# Пул воркеров компиляции (по умолчанию — по числу ядер). С внешними исполнителями
+# это число задач, одновременно отправленных им: по умолчанию — как если бы у каждого
+# исполнителя было столько же ядер, точнее задаётся COMPILEHUB_WORKER_POOL_SIZE
+WORKER_POOL_SIZE = int(os.environ.get("COMPILEHUB_WORKER_POOL_SIZE")
+                       or (os.cpu_count() or 2) * max(1, len(EXECUTOR_WORKERS)))
+
+# Рабочие папки (tmpfs): по одной на выполняемую задачу, общие для всех языков
+workspaces = WorkspacePool(size=WORKER_POOL_SIZE)
+for compiler in compilers.values():
+    compiler.workspaces = workspaces
 
-# Очередь задач компиляции
-compilation_queue = asyncio.Queue(maxsize=100)
-compilation_results = {}
+LANGUAGE_CONCURRENCY = language_concurrency(WORKER_POOL_SIZE)
+
+# Очередь задач компиляции: честная очередь по пользователям (IP) с классами приоритета.
+# Лимиты языков учитываются при выдаче задачи, поэтому воркер берёт только ту, что может начать
+compilation_queue = FairScheduler(maxsize=100, priority_weights=PRIORITY_WEIGHTS, user_weights=USER_WEIGHTS,
+                                  language_limits=LANGUAGE_CONCURRENCY)
+
+# Кеш результатов для одинаковых (язык, код, ввод)
+RESULT_CACHE_ENABLED = True
+result_cache = ResultCache(max_bytes=32 * 1024 * 1024, ttl=300)
+
+# Выполняющиеся задачи по ключу (язык, код, ввод) для объединения дублей
+inflight_tasks = {}
+
+# Проверка синтаксиса для редактора: идёт мимо очереди компиляции, со своим ограничением
+CHECK_CONCURRENCY = 2
+# Правки одного файла, пришедшие за это время (и пока проверка ждёт слот), проверяются один раз
+CHECK_DEBOUNCE = 0.02
+MAX_PENDING_CHECKS = 100
+MAX_CHECK_CODE_LENGTH = 256 * 1024
+check_semaphore = asyncio.Semaphore(CHECK_CONCURRENCY)
+check_cache = ResultCache(max_bytes=4 * 1024 * 1024, ttl=60)
+# Ожидающие проверки по файлу: {"code", "future"}; код подменяется более свежей правкой.
+# Без fileId запросы не объединяются: иначе разные файлы с одного IP подменяли бы друг друга
+pending_checks = {}
 
 # Rate limiting
 rate_limit_storage = defaultdict(lambda: {"count": 0, "reset_time": time.time() + 60})
 MAX_REQUESTS_PER_MINUTE = 30
+# Проверки синтаксиса редактор шлёт на правки — свой счётчик с более высоким лимитом
+check_rate_limit_storage = defaultdict(lambda: {"count": 0, "reset_time": time.time() + 60})
+MAX_CHECKS_PER_MINUTE = 240
 
 # Метрики
 metrics = {
@@ -44,7 +114,28 @@ metrics = {
     "failed_compilations": 0,
     "avg_compilation_time": 0,
     "compilation_times": deque(maxlen=100),
+    "compilation_times_sum": 0.0,
+    # Гистограммы длительности фаз по (язык, фаза): queue, setup, write, compile, run, parse, cleanup
+    "phase_latency": defaultdict(LatencyHistogram),
+    # Фактическое потребление запусков (rusage): время CPU, пик RSS в КБ
+    "resource_usage": {
+        language: {"cpu": LatencyHistogram(), "memory": LatencyHistogram(MEMORY_BUCKETS),
+                   "user_seconds": 0.0, "system_seconds": 0.0}
+        for language in LANGUAGE_CONCURRENCY
+    },
     "active_users": set(),
+    "busy_workers": 0,
+    "in_flight": {language: 0 for language in LANGUAGE_CONCURRENCY},
+    "coalesced_requests": 0,
+    "rejected_requests": 0,
+    "checks": 0,
+    "coalesced_checks": 0,
+    # Проверки, ещё не получившие результат (с fileId и без)
+    "waiting_checks": 0,
+    "check_latency": defaultdict(LatencyHistogram),
+    "dropped_tasks": 0,
+    # Последние времена выполнения по языкам — для оценки Retry-After
+    "service_times": {language: deque(maxlen=50) for language in LANGUAGE_CONCURRENCY},
 }
 
 # Модели Pydantic
@@ -75,72 +166,274 @@ class MigrateFilesRequest(BaseModel):
     files: List[FileItem]
 
 # Rate limiting
-def check_rate_limit(client_ip: str):
+def check_rate_limit(client_ip: str, storage: Optional[dict] = None, max_requests: Optional[int] = None):
     current_time = time.time()
-    limits = rate_limit_storage[client_ip]
+    limits = (rate_limit_storage if storage is None else storage)[client_ip]
     
     if current_time >= limits["reset_time"]:
         limits["count"] = 0
         limits["reset_time"] = current_time + 60
     
-    if limits["count"] >= MAX_REQUESTS_PER_MINUTE:
+    if limits["count"] >= (MAX_REQUESTS_PER_MINUTE if max_requests is None else max_requests):
         return False
     
     limits["count"] += 1
     return True
 
+def with_server_timing(result: dict, response: Response) -> dict:
+    """Переносит длительности фаз из ответа в заголовок Server-Timing"""
+    timings = result.pop("timings", None)
+    if timings:
+        response.headers["Server-Timing"] = server_timing(timings)
+        response.headers["Timing-Allow-Origin"] = "*"
+    return result
+
+# Контроль нагрузки
+def retry_after(language: str) -> int:
+    """Оценка, через сколько секунд очередь языка разберётся: глубина × среднее время / параллелизм"""
+    times = metrics["service_times"][language]
+    service_time = sum(times) / len(times) if times else 1.0
+    depth = compilation_queue.queued(language) + metrics["in_flight"][language]
+    estimate = depth * service_time / LANGUAGE_CONCURRENCY[language]
+    return min(MAX_RETRY_AFTER, max(1, int(estimate + 0.999)))
+
+def reject(language: str):
+    metrics["rejected_requests"] += 1
+    raise HTTPException(503, "Server is busy, try again later",
+                        headers={"Retry-After": str(retry_after(language))})
+
+def enqueue(task: dict):
+    """Ставит задачу в очередь или сразу отвечает 503, если очередь языка или общая заполнена"""
+    language = task["language"]
+    if compilation_queue.queued(language) >= LANGUAGE_QUEUE_LIMITS[language]:
+        reject(language)
+    try:
+        compilation_queue.put_nowait(task)
+    except asyncio.QueueFull:
+        reject(language)
+
+def drop_if_stale(task: dict) -> bool:
+    """Клиент ушёл или уже не дождётся результата — задачу не выполняем, CPU не тратим"""
+    future = task["future"]
+    deadline = task.get("deadline")
+    if not future.done() and (deadline is None or time.time() < deadline):
+        return False
+    metrics["dropped_tasks"] += 1
+    if not future.done():
+        future.set_result({"success": False, "error": "Compilation timeout"})
+    return True
+
 # Worker для обработки компиляций
 async def compilation_worker():
     while True:
+        task = await compilation_queue.get()
+        future = task["future"]
         try:
-            task = await compilation_queue.get()
-            task_id = task["id"]
+            if drop_if_stale(task):
+                continue
+            
             code = task["code"]
             language = task["language"]
             input_data = task.get("input", "")
+            options = task.get("options", {})
+            cases = task.get("cases")
+            if cases is not None:
+                # Тесты пакета идут параллельно не больше, чем мест языка выдал планировщик
+                options = dict(options, concurrency=task["slots"])
             
-            start_time = time.time()
+            if language not in compilers:
+                language = "cpp"
             
-            compiler = compilers.get(language, compilers["cpp"])
-            result = await compiler.compile_and_run(code, input_data)
-            
-            execution_time = time.time() - start_time
+            metrics["busy_workers"] += 1
+            metrics["in_flight"][language] += 1
+            try:
+                start_time = time.time()
+                task["started_at"] = start_time
+                run = asyncio.ensure_future(execute(language, code, input_data, options, cases))
+                # Отмена ожидания клиентом прерывает выполнение
+                future.add_done_callback(lambda f, run=run: run.cancel() if f.cancelled() else None)
+                try:
+                    result = await run
+                except asyncio.CancelledError:
+                    if not future.cancelled():
+                        raise
+                    continue
+                execution_time = time.time() - start_time
+            finally:
+                metrics["in_flight"][language] -= 1
+                metrics["busy_workers"] -= 1
             
             # Обновление метрик
             metrics["total_compilations"] += 1
             if not result["success"]:
                 metrics["failed_compilations"] += 1
-            metrics["compilation_times"].append(execution_time)
-            metrics["avg_compilation_time"] = sum(metrics["compilation_times"]) / len(metrics["compilation_times"])
+            times = metrics["compilation_times"]
+            if len(times) == times.maxlen:
+                metrics["compilation_times_sum"] -= times[0]
+            times.append(execution_time)
+            metrics["compilation_times_sum"] += execution_time
+            metrics["avg_compilation_time"] = metrics["compilation_times_sum"] / len(times)
+            metrics["service_times"][language].append(execution_time)
+            
+            timings = {"queue": start_time - task["enqueued_at"]}
+            timings.update(result.get("timings") or {})
+            for phase, seconds in timings.items():
+                metrics["phase_latency"][(language, phase)].observe(seconds)
+            result["timings"] = timings
+            record_usage(language, result)
             
             result["executionTime"] = execution_time
-            compilation_results[task_id] = result
+            if not future.done():
+                future.set_result(result)
             
         except Exception as e:
             print(f"Worker error: {e}")
-            compilation_results[task_id] = {
+            if not future.done():
+                future.set_result({
+                    "success": False,
+                    "error": str(e)
+                })
+        finally:
+            compilation_queue.task_done(task)
+
+def execute(language: str, code: str, input_data: str, options: dict, cases: Optional[List[dict]] = None):
+    """Выполнение задачи: на внешнем исполнителе, если они настроены, иначе в этом процессе"""
+    if dispatcher is not None:
+        return dispatcher.run(language, code, input_data, options, cases)
+    compiler = compilers[language]
+    if cases is not None:
+        return compiler.compile_and_run_batch(code, cases, **options)
+    return compiler.compile_and_run(code, input_data, **options)
+
+def record_usage(language: str, result: dict):
+    usage = metrics["resource_usage"][language]
+    # У пакетного запуска потребление считается по каждому тесту
+    for run in result.get("cases") or [result]:
+        if run.get("cpuTime") is not None:
+            usage["cpu"].observe(run["cpuTime"])
+        if run.get("memory"):
+            usage["memory"].observe(run["memory"])
+    usage["user_seconds"] += result.get("userTime") or 0.0
+    usage["system_seconds"] += result.get("systemTime") or 0.0
+
+def new_task(code: str, language: str, input_data: str, options: dict,
+             cases: Optional[List[dict]] = None, owner: Optional[str] = None,
+             priority: str = "interactive", timeout: float = COMPILATION_WAIT_TIMEOUT) -> dict:
+    return {
+        "id": hashlib.sha256(f"{code}{time.time()}".encode()).hexdigest()[:16],
+        "code": code,
+        "language": language,
+        "input": input_data,
+        "options": options,
+        "cases": cases,
+        "owner": owner,
+        "priority": priority,
+        # Стоимость для планировщика: пакет тестов весит по числу тестов
+        "cost": len(cases) if cases else 1,
+        # Мест языка, которые просит задача: пакет запускает до concurrency процессов сразу
+        "slots": options.get("concurrency", 1) if cases else 1,
+        # После этого момента результат никто не ждёт
+        "deadline": time.time() + timeout,
+        "future": asyncio.get_running_loop().create_future(),
+        "waiters": 0,
+    }
+
+async def submit_compilation(code: str, language: str, input_data: str, options: Optional[dict] = None,
+                             cases: Optional[List[dict]] = None,
+                             timeout: float = COMPILATION_WAIT_TIMEOUT,
+                             owner: Optional[str] = None, priority: str = "interactive") -> dict:
+    """Ставим задачу в очередь и ждём, пока воркер разрешит её future"""
+    if language not in compilers:
+        language = "cpp"
+    options = options or {}
+    
+    key_parts = [language, code, input_data, json.dumps(options, sort_keys=True)]
+    if cases is not None:
+        key_parts.append(json.dumps(cases, sort_keys=True))
+    cache_key = content_key(*key_parts)
+    if RESULT_CACHE_ENABLED:
+        lookup_start = time.perf_counter()
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            cached["cached"] = True
+            cached["timings"] = {"cache": time.perf_counter() - lookup_start}
+            return cached
+    
+    # Такая же задача уже в очереди или выполняется — присоединяемся к ней
+    task = inflight_tasks.get(cache_key)
+    # Завершённая (в том числе только что отменённая) задача ещё может лежать в inflight_tasks:
+    # колбэк, убирающий её оттуда, выполняется позже
+    leader = task is None or task["future"].done()
+    if leader:
+        task = new_task(code, language, input_data, options, cases, owner, priority, timeout)
+        inflight_tasks[cache_key] = task
+        task["future"].add_done_callback(
+            lambda _: inflight_tasks.pop(cache_key, None) if inflight_tasks.get(cache_key) is task else None
+        )
+    else:
+        metrics["coalesced_requests"] += 1
+        # Задачу выполняют, пока ждёт хоть кто-то: срок — самый поздний из сроков ожидающих
+        task["deadline"] = max(task["deadline"], time.time() + timeout)
+    
+    future = task["future"]
+    task["waiters"] += 1
+    try:
+        if leader:
+            enqueue(task)
+        
+        # Ждём результат (max 10 секунд, пакет тестов — дольше)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return {
                 "success": False,
-                "error": str(e)
+                "error": "Compilation timeout"
             }
+    finally:
+        # Последний ожидающий ушёл — задачу отменяем
+        task["waiters"] -= 1
+        if task["waiters"] == 0 and not future.done():
+            future.cancel()
+    
+    if leader and RESULT_CACHE_ENABLED and compilers[language].is_cacheable(result):
+        result_cache.put(cache_key, {key: value for key, value in result.items() if key != "timings"})
+    result = dict(result)
+    result["cached"] = False
+    return result
 
 @app.on_event("startup")
 async def startup_event():
-    db.init_db()
-    asyncio.create_task(compilation_worker())
+    await db.init_db()
+    if dispatcher is not None:
+        await dispatcher.start()
+    else:
+        workspaces.warm_up()
+        compilers["cpp"].warm_up()
+        compilers["python"].warm_up()
+        compilers["javascript"].warm_up()
+    for _ in range(WORKER_POOL_SIZE):
+        asyncio.create_task(compilation_worker())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await db.close()
+    workspaces.close()
+    if dispatcher is not None:
+        await dispatcher.close()
 
 # Auth endpoints
 @app.post("/api/auth/register")
 async def register(user: UserRegister):
-    existing = db.get_user_by_username(user.username)
+    existing = await db.get_user_by_username(user.username)
     if existing:
         raise HTTPException(400, "Username already taken")
     
-    existing_email = db.get_user_by_email(user.email)
+    existing_email = await db.get_user_by_email(user.email)
     if existing_email:
         raise HTTPException(400, "Email already registered")
     
     password_hash = hashlib.sha256(user.password.encode()).hexdigest()
-    user_id = db.create_user(user.email, user.username, password_hash)
+    user_id = await db.create_user(user.email, user.username, password_hash)
     
     return {"message": "Successfully signed up, please login", "success": True}
 
@@ -152,7 +445,7 @@ async def check_username_availability(username: str):
     if len(username) < 3 or len(username) > 20:
         raise HTTPException(400, "Username must be between 3 and 20 characters")
     
-    existing_user = db.get_user_by_username(username.strip())
+    existing_user = await db.get_user_by_username(username.strip())
     
     return {
         "available": existing_user is None,
@@ -161,7 +454,7 @@ async def check_username_availability(username: str):
 
 @app.post("/api/auth/login")
 async def login(user: UserLogin):
-    db_user = db.get_user_by_username(user.username)
+    db_user = await db.get_user_by_username(user.username)
     if not db_user:
         raise HTTPException(401, "Invalid credentials")
     
@@ -183,9 +476,30 @@ async def login(user: UserLogin):
 async def logout():
     return {"message": "Logged out successfully"}
 
+def encode_files_cursor(item: dict) -> str:
+    key = json.dumps([item["type"], item["name"], item["id"]])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def decode_files_cursor(cursor: str) -> tuple:
+    try:
+        file_type, name, file_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(file_type), str(name), int(file_id)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
 @app.get("/api/files")
-async def get_files(userId: str):
-    user_files = db.get_user_files(int(userId))
+async def get_files(userId: str, response: Response, limit: Optional[int] = None,
+                    cursor: Optional[str] = None):
+    # Без limit отдаётся весь список; с limit — страница и курсор следующей в X-Next-Cursor
+    if limit is not None and not 1 <= limit <= MAX_FILES_PAGE:
+        raise HTTPException(400, f"limit must be between 1 and {MAX_FILES_PAGE}")
+    after = decode_files_cursor(cursor) if cursor else None
+    
+    user_files = await db.list_user_files(int(userId), limit + 1 if limit else None, after)
+    if limit is not None and len(user_files) > limit:
+        user_files = user_files[:limit]
+        response.headers["X-Next-Cursor"] = encode_files_cursor(user_files[-1])
+    
     items = []
     
     for file in user_files:
@@ -204,43 +518,62 @@ async def get_files(userId: str):
 
 @app.delete("/api/files/{file_id}")
 async def delete_file(file_id: int):
-    db.delete_file(file_id)
+    await db.delete_file(file_id)
     return {"message": "File deleted"}
 
 @app.patch("/api/files/{file_id}/move")
 async def move_file(file_id: int, request: MoveFileRequest):
-    db.update_file_folder(file_id, request.folderId)
+    try:
+        await db.update_file_folder(file_id, request.folderId)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     return {"message": "File moved"}
 
 @app.post("/api/files/migrate")
 async def migrate_files(request: MigrateFilesRequest):
-    for file in request.files:
-        db.create_file(
-            user_id=int(request.userId),
-            name=file.name,
-            file_type=file.type,
-            size=file.size,
-            folder_id=file.folder,
-            code=file.code,
-            code_lang=file.code_lang
-        )
-    return {"message": "Files migrated"}
+    # Все файлы — одной транзакцией; папки клиента получают новые id
+    id_map = await db.create_files(int(request.userId), [file.model_dump() for file in request.files])
+    return {"message": "Files migrated", "ids": id_map}
 
 # Compilation endpoints
 @app.get("/api/code")
-async def get_code(fileId: int):
-    file = db.get_file_by_id(fileId)
+async def get_code(request: Request, fileId: int):
+    # ETag — хеш содержимого: неизменившийся код повторно не передаётся
+    known = request.headers.get("if-none-match", "").strip().removeprefix("W/").strip('"') or None
+    file = await db.get_file_code(fileId, known)
     if not file:
         raise HTTPException(404, "File not found")
-    return file.get("code", "")
+    
+    headers = {"ETag": f'"{file["hash"]}"', "Cache-Control": "no-cache"}
+    if file["hash"] == known:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(file["code"], headers=headers)
+
+def detect_language(code: str) -> str:
+    # Определение языка по синтаксису
+    if "#include" in code:
+        return "cpp"
+    elif "print(" in code or "def " in code or "import " in code:
+        return "python"
+    elif "console.log" in code or "function" in code or "const " in code:
+        return "javascript"
+    return "cpp"
 
 class CompileRequest(BaseModel):
     code: str
     language: Optional[str] = None
     input: Optional[str] = None
+    profile: Optional[str] = None  # C++: fast / optimized / auto
+
+def compile_options(language: str, profile: Optional[str]) -> dict:
+    if profile is None or language != "cpp":
+        return {}
+    if profile not in PROFILES:
+        raise HTTPException(400, f"Unknown profile, expected one of: {', '.join(PROFILES)}")
+    return {"profile": profile}
 
 @app.post("/api/compile/")
-async def compile_code_post(request: Request, compile_req: CompileRequest):
+async def compile_code_post(request: Request, response: Response, compile_req: CompileRequest):
     client_ip = request.client.host
     
     if not check_rate_limit(client_ip):
@@ -249,41 +582,110 @@ async def compile_code_post(request: Request, compile_req: CompileRequest):
     code = compile_req.code
     input_data = compile_req.input or ""
     
-    # Определение языка
-    language = compile_req.language
-    if not language:
-        if "#include" in code:
-            language = "cpp"
-        elif "print(" in code or "def " in code or "import " in code:
-            language = "python"
-        elif "console.log" in code or "function" in code or "const " in code:
-            language = "javascript"
-        else:
-            language = "cpp"
-    
-    task_id = hashlib.sha256(f"{code}{time.time()}".encode()).hexdigest()[:16]
-    
-    await compilation_queue.put({
-        "id": task_id,
-        "code": code,
-        "language": language,
-        "input": input_data
-    })
+    language = compile_req.language or detect_language(code)
     
-    # Ждём результат (max 10 секунд)
-    for _ in range(100):
-        if task_id in compilation_results:
-            result = compilation_results.pop(task_id)
-            return result
-        await asyncio.sleep(0.1)
+    result = await submit_compilation(code, language, input_data, compile_options(language, compile_req.profile),
+                                      owner=client_ip)
+    return with_server_timing(result, response)
+
+class TestCase(BaseModel):
+    input: Optional[str] = ""
+    expected: Optional[str] = None
+
+class BatchCompileRequest(BaseModel):
+    code: str
+    language: Optional[str] = None
+    profile: Optional[str] = None
+    cases: List[TestCase]
+    concurrency: Optional[int] = None
+    stopOnFailure: bool = False
+
+@app.post("/api/compile/batch")
+async def compile_code_batch(request: Request, response: Response, batch_req: BatchCompileRequest):
+    """Одна компиляция и прогон на наборе тестов: вердикт, вывод, время и память по каждому"""
+    client_ip = request.client.host
     
-    return {
-        "success": False,
-        "error": "Compilation timeout"
-    }
+    if not check_rate_limit(client_ip):
+        raise HTTPException(429, "Rate limit exceeded")
+    
+    if not batch_req.cases:
+        raise HTTPException(400, "At least one test case is required")
+    if len(batch_req.cases) > MAX_BATCH_CASES:
+        raise HTTPException(400, f"Too many test cases (max {MAX_BATCH_CASES})")
+    
+    code = batch_req.code
+    language = batch_req.language or detect_language(code)
+    
+    options = compile_options(language, batch_req.profile)
+    options["concurrency"] = min(max(batch_req.concurrency or BATCH_CONCURRENCY, 1), BATCH_CONCURRENCY)
+    options["stop_on_failure"] = batch_req.stopOnFailure
+    
+    cases = [{"input": case.input or "", "expected": case.expected} for case in batch_req.cases]
+    result = await submit_compilation(code, language, "", options, cases=cases, timeout=BATCH_WAIT_TIMEOUT,
+                                      owner=client_ip, priority="batch")
+    return with_server_timing(result, response)
+
+@app.post("/api/compile/stream")
+async def compile_code_stream(request: Request, compile_req: CompileRequest):
+    """Потоковая компиляция (SSE): диагностика, чанки stdout/stderr и итоговое событие exit"""
+    client_ip = request.client.host
+    
+    if not check_rate_limit(client_ip):
+        raise HTTPException(429, "Rate limit exceeded")
+    
+    code = compile_req.code
+    language = compile_req.language or detect_language(code)
+    if language not in compilers:
+        language = "cpp"
+    options = compile_options(language, compile_req.profile)
+    
+    # События от воркера; объём ограничен лимитом вывода компилятора
+    events = asyncio.Queue()
+    decoders = defaultdict(lambda: codecs.getincrementaldecoder("utf-8")(errors="replace"))
+    
+    def on_event(event: str, data: bytes):
+        text = decoders[event].decode(data)
+        if text:
+            events.put_nowait((event, {"data": text}))
+    
+    task = new_task(code, language, compile_req.input or "", dict(options, on_event=on_event),
+                    owner=client_ip)
+    future = task["future"]
+    
+    def on_done(f):
+        if f.cancelled():
+            return
+        summary = {key: value for key, value in f.result().items() if key != "output"}
+        events.put_nowait(("exit", summary))
+    future.add_done_callback(on_done)
+    
+    enqueue(task)
+    
+    async def event_stream():
+        deadline = time.time() + COMPILATION_WAIT_TIMEOUT
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), timeout=max(deadline - time.time(), 0))
+                except asyncio.TimeoutError:
+                    event, data = "exit", {"success": False, "error": "Compilation timeout"}
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == "exit":
+                    return
+        finally:
+            # Клиент отключился или время вышло — выполнение прерывается
+            if not future.done():
+                future.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/api/compile/")
-async def compile_code(request: Request, code: str, input: Optional[str] = None):
+async def compile_code(request: Request, response: Response, code: str, input: Optional[str] = None,
+                       profile: Optional[str] = None):
     client_ip = request.client.host
     
     if not check_rate_limit(client_ip):
@@ -296,26 +698,154 @@ async def compile_code(request: Request, code: str, input: Optional[str] = None)
     elif "console.log" in code or "function" in code:
         language = "javascript"
     
-    task_id = hashlib.sha256(f"{code}{time.time()}".encode()).hexdigest()[:16]
+    result = await submit_compilation(code, language, input or "", compile_options(language, profile),
+                                      owner=client_ip)
+    return with_server_timing(result, response)
+
+# Jobs API
+class JobRequest(BaseModel):
+    code: str
+    language: Optional[str] = None
+    input: Optional[str] = None
+    profile: Optional[str] = None
+    # С тестами задача выполняется как пакетная проверка
+    cases: Optional[List[TestCase]] = None
+    concurrency: Optional[int] = None
+    stopOnFailure: bool = False
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: Request, job_req: JobRequest):
+    """Ставит задачу в очередь и сразу возвращает её id; результат — через GET /api/jobs/{id}"""
+    client_ip = request.client.host
     
-    await compilation_queue.put({
-        "id": task_id,
-        "code": code,
-        "language": language,
-        "input": input or ""
-    })
+    if not check_rate_limit(client_ip):
+        raise HTTPException(429, "Rate limit exceeded")
     
-    # Ждём результат (max 10 секунд)
-    for _ in range(100):
-        if task_id in compilation_results:
-            result = compilation_results.pop(task_id)
-            return result
-        await asyncio.sleep(0.1)
+    code = job_req.code
+    language = job_req.language or detect_language(code)
+    if language not in compilers:
+        language = "cpp"
+    options = compile_options(language, job_req.profile)
     
-    return {
-        "success": False,
-        "error": "Compilation timeout"
-    }
+    cases = None
+    if job_req.cases is not None:
+        if not job_req.cases or len(job_req.cases) > MAX_BATCH_CASES:
+            raise HTTPException(400, f"Expected 1 to {MAX_BATCH_CASES} test cases")
+        cases = [{"input": case.input or "", "expected": case.expected} for case in job_req.cases]
+        options["concurrency"] = min(max(job_req.concurrency or BATCH_CONCURRENCY, 1), BATCH_CONCURRENCY)
+        options["stop_on_failure"] = job_req.stopOnFailure
+    
+    task = new_task(code, language, job_req.input or "", options, cases, owner=client_ip,
+                    priority="batch" if cases is not None else "interactive", timeout=JOB_TIMEOUT)
+    try:
+        job_id = job_store.add(task)
+    except JobStoreFull:
+        reject(language)
+    try:
+        enqueue(task)
+    except HTTPException:
+        job_store.remove(job_id)
+        raise
+    
+    return {"id": job_id, "status": "queued"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Статус и результат задачи; wait > 0 — long-poll до завершения, не дольше wait секунд"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    
+    await job_store.wait(job, min(max(wait, 0), MAX_JOB_WAIT))
+    return job_store.describe(job)
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    
+    # Отмена future прерывает выполнение, если воркер уже запустил задачу
+    job["task"]["future"].cancel()
+    return job_store.describe(job)
+
+# Проверка синтаксиса
+class CheckRequest(BaseModel):
+    code: str
+    language: Optional[str] = None
+    # Идентификатор файла в редакторе: правки одного файла объединяются
+    fileId: Optional[str] = None
+
+async def run_check(file_key: Optional[tuple], language: str, pending: dict):
+    try:
+        if file_key is not None:
+            await asyncio.sleep(CHECK_DEBOUNCE)
+        async with check_semaphore:
+            # С этого момента код не подменяется: новые правки начнут следующую проверку
+            if file_key is not None and pending_checks.get(file_key) is pending:
+                del pending_checks[file_key]
+            code = pending["code"]
+            start = time.perf_counter()
+            diagnostics = await compilers[language].check(code)
+            elapsed = time.perf_counter() - start
+        
+        metrics["checks"] += 1
+        metrics["check_latency"][language].observe(elapsed)
+        result = {
+            "language": language,
+            "ok": not any(d["severity"] == "error" for d in diagnostics),
+            "diagnostics": diagnostics,
+            "time": round(elapsed, 4),
+        }
+        check_cache.put(content_key(language, code), result)
+        pending["future"].set_result((code, result))
+    except Exception as e:
+        pending["future"].set_exception(e)
+    finally:
+        metrics["waiting_checks"] -= 1
+        if file_key is not None and pending_checks.get(file_key) is pending:
+            del pending_checks[file_key]
+
+@app.post("/api/check")
+async def check_code(request: Request, check_req: CheckRequest):
+    """Быстрая проверка синтаксиса без запуска; вызывается редактором на каждую правку"""
+    if not check_rate_limit(request.client.host, check_rate_limit_storage, MAX_CHECKS_PER_MINUTE):
+        raise HTTPException(429, "Rate limit exceeded")
+    
+    code = check_req.code
+    if len(code) > MAX_CHECK_CODE_LENGTH:
+        raise HTTPException(413, "Code is too long")
+    language = check_req.language or detect_language(code)
+    if language not in compilers:
+        language = "cpp"
+    
+    cached = check_cache.get(content_key(language, code))
+    if cached is not None:
+        cached["cached"] = True
+        cached["superseded"] = False
+        return cached
+    
+    file_key = None
+    if check_req.fileId is not None:
+        file_key = (request.client.host, check_req.fileId, language)
+    pending = pending_checks.get(file_key) if file_key is not None else None
+    if pending is not None:
+        # Проверка этого файла ещё не началась — проверяем только последнюю версию
+        pending["code"] = code
+        metrics["coalesced_checks"] += 1
+    else:
+        if metrics["waiting_checks"] >= MAX_PENDING_CHECKS:
+            metrics["rejected_requests"] += 1
+            raise HTTPException(503, "Server is busy, try again later", headers={"Retry-After": "1"})
+        pending = {"code": code, "future": asyncio.get_running_loop().create_future()}
+        if file_key is not None:
+            pending_checks[file_key] = pending
+        metrics["waiting_checks"] += 1
+        asyncio.ensure_future(run_check(file_key, language, pending))
+    
+    checked_code, result = await asyncio.shield(pending["future"])
+    # superseded: результат относится к более новой версии файла, пришедшей следом
+    return dict(result, cached=False, superseded=checked_code != code)
 
 # Metrics endpoint
 @app.get("/api/metrics")
@@ -326,9 +856,130 @@ async def get_metrics():
         "success_rate": ((metrics["total_compilations"] - metrics["failed_compilations"]) / max(metrics["total_compilations"], 1)) * 100,
         "avg_compilation_time": round(metrics["avg_compilation_time"], 3),
         "active_users": len(metrics["active_users"]),
-        "queue_size": compilation_queue.qsize()
+        "queue_size": compilation_queue.qsize(),
+        "scheduler": compilation_queue.stats(),
+        "worker_pool_size": WORKER_POOL_SIZE,
+        "busy_workers": metrics["busy_workers"],
+        "in_flight": dict(metrics["in_flight"]),
+        "concurrency_limits": dict(LANGUAGE_CONCURRENCY),
+        "binary_cache": compilers["cpp"].binary_cache.stats(),
+        "precompiled_headers": compilers["cpp"].pch.stats(),
+        "python_pool": compilers["python"].pool.stats(),
+        "javascript_pool": compilers["javascript"].pool.stats(),
+        "result_cache": result_cache.stats(),
+        "workspaces": workspaces.stats(),
+        "cgroups": job_cgroups.stats(),
+        "executors": dispatcher.stats() if dispatcher is not None else None,
+        "coalesced_requests": metrics["coalesced_requests"],
+        "rejected_requests": metrics["rejected_requests"],
+        "dropped_tasks": metrics["dropped_tasks"],
+        "checks": check_stats(),
+        "queue_limits": dict(LANGUAGE_QUEUE_LIMITS),
+        "jobs": job_store.stats(),
+        "db_latency": db.latency_stats(),
+        "phases": phase_stats(),
+        "resources": resource_stats(),
+    }
+
+def phase_stats() -> dict:
+    phases = defaultdict(dict)
+    for (language, phase), histogram in sorted(metrics["phase_latency"].items()):
+        phases[language][phase] = histogram.snapshot()
+    return dict(phases)
+
+def check_stats() -> dict:
+    return {
+        "total": metrics["checks"],
+        "coalesced": metrics["coalesced_checks"],
+        "pending": metrics["waiting_checks"],
+        "cache": check_cache.stats(),
+        "latency": {language: histogram.snapshot()
+                    for language, histogram in sorted(metrics["check_latency"].items())},
     }
 
+def resource_stats() -> dict:
+    return {
+        language: {
+            "cpu_seconds": usage["cpu"].snapshot(),
+            "user_seconds_total": round(usage["user_seconds"], 3),
+            "system_seconds_total": round(usage["system_seconds"], 3),
+            "memory_kb": usage["memory"].snapshot(),
+        }
+        for language, usage in metrics["resource_usage"].items()
+    }
+
+@app.get("/api/metrics/prometheus", response_class=PlainTextResponse)
+async def get_metrics_prometheus():
+    """Метрики в текстовом формате Prometheus"""
+    lines = [
+        "# HELP compilehub_phase_seconds Duration of compile/run phases.",
+        "# TYPE compilehub_phase_seconds histogram",
+    ]
+    for (language, phase), histogram in sorted(metrics["phase_latency"].items()):
+        lines += prometheus_histogram("compilehub_phase_seconds", {"language": language, "phase": phase}, histogram)
+    
+    lines += [
+        "# HELP compilehub_queue_wait_seconds Time tasks spend in the scheduler queue.",
+        "# TYPE compilehub_queue_wait_seconds histogram",
+    ]
+    for priority, histogram in compilation_queue.wait_times.items():
+        lines += prometheus_histogram("compilehub_queue_wait_seconds", {"priority": priority}, histogram)
+    
+    lines += [
+        "# HELP compilehub_db_query_seconds Database query latency by method.",
+        "# TYPE compilehub_db_query_seconds histogram",
+    ]
+    for method, histogram in sorted(db.latency.items()):
+        lines += prometheus_histogram("compilehub_db_query_seconds", {"method": method}, histogram)
+    
+    lines += [
+        "# HELP compilehub_run_cpu_seconds CPU time (user + system) used by each run.",
+        "# TYPE compilehub_run_cpu_seconds histogram",
+    ]
+    for language, usage in metrics["resource_usage"].items():
+        lines += prometheus_histogram("compilehub_run_cpu_seconds", {"language": language}, usage["cpu"])
+    
+    lines += [
+        "# HELP compilehub_run_peak_memory_kilobytes Peak RSS of each run.",
+        "# TYPE compilehub_run_peak_memory_kilobytes histogram",
+    ]
+    for language, usage in metrics["resource_usage"].items():
+        lines += prometheus_histogram("compilehub_run_peak_memory_kilobytes", {"language": language}, usage["memory"])
+    
+    lines += [
+        "# HELP compilehub_check_seconds Duration of syntax checks.",
+        "# TYPE compilehub_check_seconds histogram",
+    ]
+    for language, histogram in sorted(metrics["check_latency"].items()):
+        lines += prometheus_histogram("compilehub_check_seconds", {"language": language}, histogram)
+    
+    for mode in ("user", "system"):
+        name = f"compilehub_run_{mode}_cpu_seconds_total"
+        lines.append(f"# TYPE {name} counter")
+        for language, usage in metrics["resource_usage"].items():
+            lines.append(f'{name}{{language="{language}"}} {usage[mode + "_seconds"]}')
+    
+    counters = {
+        "compilehub_compilations_total": metrics["total_compilations"],
+        "compilehub_compilations_failed_total": metrics["failed_compilations"],
+        "compilehub_coalesced_requests_total": metrics["coalesced_requests"],
+        "compilehub_rejected_requests_total": metrics["rejected_requests"],
+        "compilehub_dropped_tasks_total": metrics["dropped_tasks"],
+        "compilehub_checks_total": metrics["checks"],
+        "compilehub_coalesced_checks_total": metrics["coalesced_checks"],
+    }
+    for name, value in counters.items():
+        lines += [f"# TYPE {name} counter", f"{name} {value}"]
+    
+    gauges = {
+        "compilehub_queue_size": compilation_queue.qsize(),
+        "compilehub_busy_workers": metrics["busy_workers"],
+    }
+    for name, value in gauges.items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    
+    return "\n".join(lines) + "\n"
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="192.168.3.29", port=9999)
\ No newline at end of file
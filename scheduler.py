@@ -0,0 +1,225 @@
+import asyncio, time
+
+from collections import OrderedDict, deque
+from typing import Dict, Any, Callable, Hashable, Optional
+
+from telemetry import LatencyHistogram
+
+# Классы приоритета в порядке важности и их доли при выдаче задач:
+# интерактивные запуски получают 4 задачи на каждую задачу проверки
+PRIORITY_WEIGHTS = {
+    "interactive": 4,
+    "batch": 1,
+}
+DEFAULT_PRIORITY = "interactive"
+
+# Сколько «работы» получает пользователь за один обход (в единицах стоимости задачи)
+SCHEDULER_QUANTUM = 1.0
+
+# Сколько пользователей хранить в статистике ожидания
+MAX_TRACKED_OWNERS = 1000
+
+NO_KEY = object()
+
+
+class DeficitRoundRobin:
+    """Deficit round robin: очереди по ключам, за обход ключ получает quantum * вес"""
+
+    def __init__(self, quantum: float, weight: Callable[[Hashable], float]):
+        self.quantum = quantum
+        self.weight = weight
+        # Только непустые очереди, в порядке обхода
+        self.queues: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self.deficits: Dict[Hashable, float] = {}
+        self.current: Any = NO_KEY
+        self.size = 0
+
+    def push(self, key: Hashable, item: Any, cost: float = 1.0):
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            self.deficits[key] = 0.0
+        queue.append((item, cost))
+        self.size += 1
+
+    @staticmethod
+    def _first(queue: deque, eligible: Optional[Callable[[Any], bool]]) -> Optional[int]:
+        for index, (item, _) in enumerate(queue):
+            if eligible is None or eligible(item):
+                return index
+        return None
+
+    def has(self, eligible: Callable[[Any], bool]) -> bool:
+        return any(self._first(queue, eligible) is not None for queue in self.queues.values())
+
+    def pop(self, eligible: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Следующий элемент; eligible — фильтр: неподходящие элементы остаются в очереди,
+        а ключ без подходящих элементов пропускается, сохраняя место и кредит.
+        Если подходящих элементов нет, возвращает None"""
+        blocked = set()
+        while True:
+            # Ключ может быть None (задача без владельца), поэтому «нет ключа» — отдельный маркер
+            key = next((key for key in self.queues if key not in blocked), NO_KEY)
+            if key is NO_KEY:
+                return None
+            queue = self.queues[key]
+            index = self._first(queue, eligible)
+            if index is None:
+                blocked.add(key)
+                continue
+
+            if key != self.current:
+                # Новый ход ключа: начисляем квант
+                self.current = key
+                self.deficits[key] += self.quantum * self.weight(key)
+
+            item, cost = queue[index]
+            if cost <= self.deficits[key]:
+                self.deficits[key] -= cost
+                del queue[index]
+                self.size -= 1
+                if not queue:
+                    # Опустевшая очередь не копит кредит
+                    del self.queues[key]
+                    del self.deficits[key]
+                    self.current = NO_KEY
+                return item
+
+            self.queues.move_to_end(key)
+            self.current = NO_KEY
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class FairScheduler:
+    """Очередь задач с честным разделением между пользователями.
+
+    Выбор класса приоритета — взвешенный round robin по PRIORITY_WEIGHTS,
+    внутри класса — deficit round robin по владельцам задач (пользователь или IP)
+    с весами user_weights. Интерфейс как у asyncio.Queue (put_nowait/get/task_done/qsize),
+    но put_nowait сразу отказывает при переполнении — ждать места в очереди некому.
+
+    language_limits ограничивает число выполняющихся задач каждого языка: get() выдаёт
+    только задачи языков, у которых есть свободное место, а task_done(task) его освобождает.
+    Так воркер не держит задачу, которую не может начать, пока ждут задачи других языков.
+    Задача, запускающая несколько процессов (пакет тестов), просит slots мест; get() отдаёт
+    ей сколько свободно, но не меньше одного, и записывает выданное число в task["slots"].
+
+    Задача — словарь; используются поля owner, priority, cost (стоимость для DRR),
+    language (для лимитов и подсчёта очереди по языкам) и slots (по умолчанию 1).
+    """
+
+    def __init__(self, maxsize: int = 0, quantum: float = SCHEDULER_QUANTUM,
+                 priority_weights: Optional[Dict[str, float]] = None,
+                 user_weights: Optional[Dict[str, float]] = None,
+                 language_limits: Optional[Dict[str, int]] = None):
+        self.maxsize = maxsize
+        self.language_limits = dict(language_limits or {})
+        self.running_by_language: Dict[str, int] = {}
+        self.priority_weights = dict(priority_weights or PRIORITY_WEIGHTS)
+        self.user_weights = user_weights if user_weights is not None else {}
+
+        self.classes = DeficitRoundRobin(1.0, lambda priority: self.priority_weights.get(priority, 1))
+        self.owners = {
+            priority: DeficitRoundRobin(quantum, lambda owner: self.user_weights.get(owner, 1.0))
+            for priority in self.priority_weights
+        }
+
+        # Появилась задача или освободилось место языка — ожидающие get() проверяют очередь
+        self.changed = asyncio.Event()
+        self.unfinished = 0
+        self.queued_by_language: Dict[str, int] = {}
+
+        self.wait_times = {priority: LatencyHistogram() for priority in self.priority_weights}
+        self.owner_wait_times: "OrderedDict[str, LatencyHistogram]" = OrderedDict()
+
+    def qsize(self) -> int:
+        return len(self.classes)
+
+    def full(self) -> bool:
+        return self.maxsize > 0 and self.qsize() >= self.maxsize
+
+    def queued(self, language: str) -> int:
+        return self.queued_by_language.get(language, 0)
+
+    def put_nowait(self, task: Dict[str, Any]):
+        if self.full():
+            raise asyncio.QueueFull
+        priority = task.get("priority") or DEFAULT_PRIORITY
+        if priority not in self.owners:
+            priority = DEFAULT_PRIORITY
+        task["priority"] = priority
+        task["enqueued_at"] = time.time()
+
+        self.owners[priority].push(task.get("owner"), task, task.get("cost", 1.0))
+        self.classes.push(priority, priority)
+        language = task.get("language")
+        self.queued_by_language[language] = self.queued_by_language.get(language, 0) + 1
+        self.unfinished += 1
+        self.changed.set()
+
+    def _startable(self, task: Dict[str, Any]) -> bool:
+        language = task.get("language")
+        limit = self.language_limits.get(language)
+        return limit is None or self.running_by_language.get(language, 0) < limit
+
+    def _pop(self) -> Optional[Dict[str, Any]]:
+        priority = self.classes.pop(lambda priority: self.owners[priority].has(self._startable))
+        if priority is None:
+            return None
+        return self.owners[priority].pop(self._startable)
+
+    async def get(self) -> Dict[str, Any]:
+        while True:
+            task = self._pop()
+            if task is not None:
+                break
+            # Между _pop и clear нет await: изменение после clear снова выставит событие
+            self.changed.clear()
+            await self.changed.wait()
+
+        language = task.get("language")
+        running = self.running_by_language.get(language, 0)
+        limit = self.language_limits.get(language)
+        slots = task.get("slots", 1)
+        if limit is not None:
+            slots = max(1, min(slots, limit - running))
+        task["slots"] = slots
+        self.queued_by_language[language] -= 1
+        self.running_by_language[language] = running + slots
+
+        self._record_wait(task, time.time() - task["enqueued_at"])
+        return task
+
+    def task_done(self, task: Dict[str, Any]):
+        """Задача, полученная через get(), завершена: освобождает место её языка"""
+        self.unfinished -= 1
+        self.running_by_language[task.get("language")] -= task.get("slots", 1)
+        self.changed.set()
+
+    def _record_wait(self, task: Dict[str, Any], wait: float):
+        self.wait_times[task["priority"]].observe(wait)
+
+        owner = str(task.get("owner"))
+        histogram = self.owner_wait_times.get(owner)
+        if histogram is None:
+            histogram = self.owner_wait_times[owner] = LatencyHistogram()
+            while len(self.owner_wait_times) > MAX_TRACKED_OWNERS:
+                self.owner_wait_times.popitem(last=False)
+        self.owner_wait_times.move_to_end(owner)
+        histogram.observe(wait)
+
+    def stats(self, top_owners: int = 20) -> Dict[str, Any]:
+        # Самые активные пользователи по числу задач
+        busiest = sorted(self.owner_wait_times.items(), key=lambda item: item[1].count, reverse=True)
+        return {
+            "queued": {priority: len(queue) for priority, queue in self.owners.items()},
+            "queued_by_language": dict(self.queued_by_language),
+            "running_by_language": dict(self.running_by_language),
+            "language_limits": dict(self.language_limits),
+            "queued_owners": {priority: len(queue.queues) for priority, queue in self.owners.items()},
+            "priority_weights": dict(self.priority_weights),
+            "wait": {priority: histogram.snapshot() for priority, histogram in self.wait_times.items()},
+            "wait_by_owner": {owner: histogram.snapshot() for owner, histogram in busiest[:top_owners]},
+        }
@@ -0,0 +1,98 @@
+import bisect, contextvars, time
+
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+# Границы корзин гистограммы задержек (секунды): от 0.1 мс до ~100 с, шаг ×2
+LATENCY_BUCKETS = [0.0001 * 2 ** i for i in range(21)]
+# Границы корзин пикового потребления памяти (КБ): от 256 КБ до 2 ГБ
+MEMORY_BUCKETS = [256 * 2 ** i for i in range(14)]
+
+
+class LatencyHistogram:
+    """Гистограмма задержек (или других величин — корзины задаются) с фиксированными корзинами:
+    O(1) по памяти, квантили — оценка сверху"""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Последняя корзина — всё, что больше верхней границы
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg": round(self.mean, 6),
+            "p50": round(self.quantile(0.5), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+# Фазы текущей задачи: словарь фаза -> секунды, общий для всех корутин задачи
+current_spans: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "current_spans", default=None
+)
+
+
+def start_spans() -> Dict[str, float]:
+    """Начинает сбор фаз для текущей задачи (и порождённых ею корутин)"""
+    spans: Dict[str, float] = {}
+    current_spans.set(spans)
+    return spans
+
+
+@contextmanager
+def span(phase: str):
+    """Замер фазы; повторные замеры одной фазы (тесты пакета) суммируются"""
+    spans = current_spans.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if spans is not None:
+            spans[phase] = spans.get(phase, 0.0) + time.perf_counter() - start
+
+
+def server_timing(spans: Dict[str, float]) -> str:
+    """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+    return ", ".join(f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in spans.items())
+
+
+def prometheus_histogram(name: str, labels: Dict[str, str], histogram: LatencyHistogram) -> List[str]:
+    """Строки гистограммы в текстовом формате Prometheus (корзины накопительные)"""
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = label_text + "," if label_text else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{label_text}}} {histogram.total}")
+    lines.append(f"{name}_count{{{label_text}}} {histogram.count}")
+    return lines
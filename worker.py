@@ -0,0 +1,49 @@
+"""Отдельный процесс-исполнитель задач компиляции.
+
+    python worker.py unix:/run/compilehub-1.sock
+    python worker.py tcp:0.0.0.0:7001 --slots 8
+
+API отправляет сюда задачи, если исполнители перечислены в COMPILEHUB_WORKERS
+(через запятую, в том же формате адресов).
+"""
+import argparse, asyncio, os
+
+from compilers.registry import create_compilers, language_concurrency
+from compilers.workspace import WorkspacePool
+from executor import WorkerServer, parse_transport
+
+
+async def serve(address: str, slots: int):
+    compilers = create_compilers()
+    workspaces = WorkspacePool(size=slots)
+    for compiler in compilers.values():
+        compiler.workspaces = workspaces
+
+    workspaces.warm_up()
+    for compiler in compilers.values():
+        compiler.warm_up()
+
+    worker = WorkerServer(compilers, language_concurrency(slots))
+    transport = parse_transport(address)
+    await transport.serve(worker.handle)
+    print(f"Worker {os.getpid()} listening on {transport} ({slots} slots)", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        workspaces.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CompileHub execution worker")
+    parser.add_argument("address", help="unix:/path/to.sock or tcp:host:port")
+    parser.add_argument("--slots", type=int, default=os.cpu_count() or 2,
+                        help="concurrent jobs (default: number of CPU cores)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.address, args.slots))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()